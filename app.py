@@ -1,5 +1,6 @@
 import os
 import sys
+import sqlite3
 
 # Adiciona o diretório atual (onde está app.py) ao sys.path
 # Isso garante que 'database.py' e a pasta 'routes' sejam encontrados
@@ -8,8 +9,11 @@ sys.path.insert(0, BASE_DIR)
 
 from flask import Flask
 from flask_login import LoginManager
+import database
+import migrations
+import senhas
 from database import get_cadastro_conn  # Agora a importação deve funcionar
-from models import User
+from models import User, usuarios_cache, guardar_usuario
 
 # Importação dos Blueprints
 from routes.auth import auth_bp
@@ -25,12 +29,39 @@ app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'uploads')  # Usando caminho absoluto
 app.config['SECRET_KEY'] = 'chave_super_secreta_amec_2025'
+# Leituras de dashboard: 'transacao' (snapshot WAL por request) ou 'copia' (cópias periódicas via backup)
+app.config['DB_MODO_LEITURA'] = os.getenv('DB_MODO_LEITURA', 'transacao')
+app.config['DB_SNAPSHOT_TTL'] = int(os.getenv('DB_SNAPSHOT_TTL', '60'))
+# Catálogo de procedimentos e totais de produção mantidos em memória (recarregados quando o banco muda).
+# Desligado, as consultas vão ao SQLite e passam pelo cache de consultas de routes/producao.py.
+app.config['CATALOGO_EM_MEMORIA'] = os.getenv('CATALOGO_EM_MEMORIA', '1') == '1'
 
 # Garante pastas
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 db_dir = os.path.join(BASE_DIR, 'db')
 if not os.path.exists(db_dir): os.makedirs(db_dir)
 
+# As migrações rodam só por `python migrations.py` (ou pelos scripts de setup), nunca ao importar o app:
+# aqui o esquema é apenas conferido, e enquanto divergir o app responde 503 em vez de servir
+_esquema = {'conferido': False}
+_divergentes = migrations.esquemas_divergentes()
+if _divergentes: app.logger.error(migrations.descrever_divergencias(_divergentes))
+
+
+@app.before_request
+def exigir_esquema_atual():
+    if _esquema['conferido']: return None
+    divergentes = migrations.esquemas_divergentes()
+    if divergentes: return migrations.descrever_divergencias(divergentes), 503
+    _esquema['conferido'] = True
+    return None
+
+
+# Pool de conexões SQLite (uma conexão por banco em cada app context)
+database.init_app(app)
+# Pool de processos para hash de senhas (só no processo do app, não nos workers do pool)
+senhas.init_app(app)
+
 # Configuração Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -40,6 +71,9 @@ login_manager.login_message = "Por favor, faça login para acessar o sistema."
 
 @login_manager.user_loader
 def load_user(user_id):
+    user = usuarios_cache.obter(str(user_id))
+    if user is not None: return user
+
     conn = get_cadastro_conn()
     # Verifica se a tabela existe antes de tentar buscar usuário
     try:
@@ -49,7 +83,7 @@ def load_user(user_id):
     finally:
         conn.close()
 
-    if row: return User(row['id'], row['nome_completo'], row['email'], row['nivel_acesso'], row['primeiro_acesso'])
+    if row: return guardar_usuario(User.from_row(row))
     return None
 
 
@@ -64,4 +98,6 @@ app.register_blueprint(configuracoes_bp)
 app.register_blueprint(geral_bp)
 
 if __name__ == '__main__':
+    _divergentes = migrations.esquemas_divergentes()
+    if _divergentes: sys.exit(migrations.descrever_divergencias(_divergentes))
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,21 @@
+import re
+import unicodedata
+
+
+def remover_acentos(texto):
+    nfkd = unicodedata.normalize('NFKD', texto)
+    return "".join([c for c in nfkd if not unicodedata.combining(c)])
+
+
+def consulta_fts(termo, coluna_codigo=None):
+    """
+    Texto digitado -> expressão MATCH do FTS5: cada palavra (sem acentos) vira um prefixo e todas
+    devem casar. Números com pontuação (CPF, CRM, código SIGTAP) são buscados só pelos dígitos,
+    restritos a `coluna_codigo` quando informada.
+    """
+    termo = remover_acentos(termo).lower()
+    if re.fullmatch(r'[\d.\-/\s]+', termo):
+        digitos = re.sub(r'\D', '', termo)
+        if not digitos: return ''
+        return f'{coluna_codigo} : "{digitos}"*' if coluna_codigo else f'"{digitos}"*'
+    return ' AND '.join(f'"{p}"*' for p in re.findall(r'\w+', termo))
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+_AUSENTE = object()
+
+
+class CacheLRU:
+    """
+    Cache em memória do processo, limitado a `maximo` itens (descarta o menos usado),
+    com expiração opcional por item (`ttl`, em segundos) e contadores de acerto/falha.
+    Seguro para uso entre threads.
+    """
+
+    def __init__(self, maximo=256, ttl=None):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._itens = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            item = self._itens.get(chave, _AUSENTE)
+            if item is not _AUSENTE and (item[0] is None or item[0] > time.monotonic()):
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item[1]
+            if item is not _AUSENTE:
+                del self._itens[chave]
+            self.falhas += 1
+            return padrao
+
+    def guardar(self, chave, valor, ttl=_AUSENTE):
+        ttl = self.ttl if ttl is _AUSENTE else ttl
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo:
+                self._itens.popitem(last=False)
+                self.descartes += 1
+        return valor
+
+    def retirar(self, chave, padrao=None):
+        """Remove e devolve o item (sem contar acerto/falha)."""
+        with self._lock:
+            item = self._itens.pop(chave, _AUSENTE)
+        if item is _AUSENTE or (item[0] is not None and item[0] <= time.monotonic()):
+            return padrao
+        return item[1]
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def invalidar_se(self, predicado):
+        """Remove todas as chaves para as quais predicado(chave) é verdadeiro."""
+        with self._lock:
+            for chave in [c for c in self._itens if predicado(c)]:
+                del self._itens[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'itens': len(self._itens),
+            'maximo': self.maximo,
+            'ttl': self.ttl,
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'descartes': self.descartes,
+            'taxa_acerto': round(self.acertos / total, 4) if total else 0.0,
+        }
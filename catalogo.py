@@ -0,0 +1,215 @@
+"""
+Catálogo de procedimentos residente no processo.
+
+Procedimentos (código, nome, valor SIGTAP e primeira classificação) ficam em registros com
+__slots__, com um índice de prefixos das palavras do nome, um índice de prefixos dos códigos
+(só dígitos) e um índice de trigramas para buscas no meio da palavra. Os totais de produção
+ficam em array('d') de 12 meses por (código, ano).
+
+A cada consulta o catálogo compara o PRAGMA data_version do banco (database.versao_dados);
+quando muda, lê os contadores de catalogo_sequencia (mantidos por triggers, migração v5 de
+produção): o cadastro é recarregado só se o contador dele mudou, e da produção são relidas só as
+células (código, ano, mês) registradas em producao_fato_alteracoes depois da última leitura.
+"""
+
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from busca import remover_acentos
+from database import get_db_connection, versao_dados
+
+SQL_PRODUCAO_ALTERADA = """
+    SELECT a.codigo_sigtap, a.ano, a.mes,
+           (SELECT sum(quantidade) FROM producao_fato f
+            WHERE f.codigo_sigtap = a.codigo_sigtap AND f.ano = a.ano AND f.mes = a.mes)
+    FROM producao_fato_alteracoes a
+    WHERE a.versao > ?
+"""
+
+
+class Procedimento:
+    __slots__ = ('codigo', 'digitos', 'nome', 'nome_busca', 'valor', 'tipo', 'especialidade')
+
+    def __init__(self, codigo, nome, valor, tipo, especialidade):
+        self.codigo = codigo
+        self.digitos = re.sub(r'\D', '', codigo or '')
+        self.nome = nome or ''
+        self.nome_busca = remover_acentos(self.nome).lower()
+        self.valor = valor or 0
+        self.tipo = tipo
+        self.especialidade = especialidade
+
+
+def normalizar_termo(termo):
+    return remover_acentos(termo or '').lower()
+
+
+class _Indice:
+    def __init__(self, procedimentos):
+        self.palavras = sorted((p, i) for i, proc in enumerate(procedimentos) for p in set(re.findall(r'\w+', proc.nome_busca)))
+        self.chaves_palavras = [p for p, _ in self.palavras]
+        self.codigos = sorted((proc.digitos, i) for i, proc in enumerate(procedimentos) if proc.digitos)
+        self.chaves_codigos = [c for c, _ in self.codigos]
+        self.trigramas = {}
+        for i, proc in enumerate(procedimentos):
+            for j in range(len(proc.nome_busca) - 2):
+                self.trigramas.setdefault(proc.nome_busca[j:j + 3], set()).add(i)
+
+    @staticmethod
+    def _com_prefixo(chaves, pares, prefixo):
+        inicio = bisect_left(chaves, prefixo)
+        fim = bisect_left(chaves, prefixo + '\uffff')
+        return {i for _, i in pares[inicio:fim]}
+
+    def por_palavras(self, palavras):
+        """Procedimentos em que cada palavra buscada é prefixo de alguma palavra do nome."""
+        candidatos = None
+        for palavra in palavras:
+            achados = self._com_prefixo(self.chaves_palavras, self.palavras, palavra)
+            candidatos = achados if candidatos is None else candidatos & achados
+            if not candidatos: return set()
+        return candidatos or set()
+
+    def por_codigo(self, digitos):
+        return self._com_prefixo(self.chaves_codigos, self.codigos, digitos)
+
+    def por_trigramas(self, palavras):
+        """Busca no meio das palavras (equivalente ao antigo LIKE '%termo%')."""
+        candidatos = None
+        for palavra in palavras:
+            for j in range(len(palavra) - 2):
+                achados = self.trigramas.get(palavra[j:j + 3], set())
+                candidatos = set(achados) if candidatos is None else candidatos & achados
+                if not candidatos: return set()
+        return candidatos or set()
+
+
+class CatalogoProcedimentos:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._versao = None
+        self._seq_cadastro = None
+        self._seq_producao = None
+        self.cadastro = ([], _Indice([]))  # (procedimentos, índice) trocados juntos numa única atribuição
+        self.por_codigo = {}
+        self.classificados = set()
+        self.producao = {}  # (codigo, ano) -> array('d') com os 12 meses
+        self.recargas = {'cadastro': 0, 'producao': 0, 'producao_incremental': 0}
+
+    def _carregar_cadastro(self, conn):
+        mapa_esp, mapa_tipo = {}, {}
+        for r in conn.execute("SELECT * FROM especialidades"):
+            if len(r) >= 2: mapa_esp[str(r[0])] = str(r[1])
+        for r in conn.execute("SELECT * FROM tipo_cma"):
+            if len(r) >= 2: mapa_tipo[str(r[0])] = str(r[1])
+        procedimentos = []
+        for r in conn.execute("""
+            SELECT p.codigo_sigtap, p.nome, p.valor_sigtap, c.tipo, c.especialidade
+            FROM procedimentos p
+            LEFT JOIN producao_classificacao c
+                   ON c.id = (SELECT min(id) FROM producao_classificacao WHERE codigo_sigtap = p.codigo_sigtap)
+            ORDER BY p.id
+        """):
+            ct, ce = str(r['tipo'] or ''), str(r['especialidade'] or '')
+            procedimentos.append(Procedimento(
+                r['codigo_sigtap'], r['nome'], r['valor_sigtap'],
+                mapa_tipo.get(ct, ct) if ct else "Não classificado",
+                mapa_esp.get(ce, ce) if ce else "Geral"))
+        por_codigo = {}
+        for proc in procedimentos: por_codigo.setdefault(proc.codigo, proc)
+        self.cadastro = (procedimentos, _Indice(procedimentos))
+        self.por_codigo = por_codigo
+        self.classificados = {r[0] for r in conn.execute("SELECT DISTINCT codigo_sigtap FROM producao_classificacao")}
+        self.recargas['cadastro'] += 1
+
+    def _carregar_producao(self, conn):
+        producao = {}
+        for cod, ano, mes, total in conn.execute(
+                "SELECT codigo_sigtap, ano, mes, sum(quantidade) FROM producao_fato GROUP BY codigo_sigtap, ano, mes"):
+            meses = producao.get((cod, ano))
+            if meses is None: meses = producao[(cod, ano)] = array('d', [0.0] * 12)
+            meses[mes - 1] = total
+        self.producao = producao
+        self.recargas['producao'] += 1
+
+    def _aplicar_alteracoes_producao(self, conn, desde):
+        """Relê só as células alteradas depois de `desde`; os arrays tocados são copiados e trocados juntos."""
+        producao, copiados = dict(self.producao), set()
+        for cod, ano, mes, total in conn.execute(SQL_PRODUCAO_ALTERADA, (desde,)):
+            if (cod, ano) not in copiados:
+                meses = producao.get((cod, ano))
+                producao[(cod, ano)] = array('d', meses) if meses is not None else array('d', [0.0] * 12)
+                copiados.add((cod, ano))
+            producao[(cod, ano)][mes - 1] = total or 0
+        self.producao = producao
+        self.recargas['producao_incremental'] += 1
+
+    def atualizar(self):
+        versao = versao_dados(self.db_path)
+        if versao == self._versao: return
+        with self._lock:
+            if versao == self._versao: return
+            conn = get_db_connection(self.db_path)
+            iniciou = not conn.in_transaction
+            try:
+                # Contadores e dados lidos na mesma transação de leitura (mesmo snapshot)
+                if iniciou: conn.execute("BEGIN")
+                seq_cadastro, seq_producao = conn.execute(
+                    "SELECT cadastro, producao FROM catalogo_sequencia WHERE id = 1").fetchone()
+                if seq_cadastro != self._seq_cadastro:
+                    self._carregar_cadastro(conn)
+                    self._seq_cadastro = seq_cadastro
+                if self._seq_producao is None or seq_producao < self._seq_producao:
+                    self._carregar_producao(conn)  # primeira carga ou banco recriado
+                elif seq_producao != self._seq_producao:
+                    self._aplicar_alteracoes_producao(conn, self._seq_producao)
+                self._seq_producao = seq_producao
+            finally:
+                if iniciou: conn.rollback()
+                conn.close()
+            self._versao = versao
+
+    def obter(self, codigo):
+        self.atualizar()
+        return self.por_codigo.get(codigo)
+
+    def buscar(self, termo, limite=15):
+        """Busca por palavras (prefixo, sem acentos) ou por código com ou sem pontuação."""
+        self.atualizar()
+        procedimentos, indice = self.cadastro
+        termo = normalizar_termo(termo)
+        if re.fullmatch(r'[\d.\-/\s]+', termo):
+            digitos = re.sub(r'\D', '', termo)
+            if not digitos: return []
+            achados = indice.por_codigo(digitos)
+            return sorted((procedimentos[i] for i in achados), key=lambda p: p.digitos)[:limite]
+        palavras = re.findall(r'\w+', termo)
+        if not palavras: return []
+        achados = indice.por_palavras(palavras) or {
+            i for i in indice.por_trigramas(palavras) if all(p in procedimentos[i].nome_busca for p in palavras)}
+        # Nome que começa pela primeira palavra vem antes; depois os nomes mais curtos
+        primeira = palavras[0]
+        return sorted((procedimentos[i] for i in achados),
+                      key=lambda p: (not p.nome_busca.startswith(primeira), len(p.nome), p.nome_busca))[:limite]
+
+    def total_mes(self, codigo, ano, mes):
+        self.atualizar()
+        meses = self.producao.get((codigo, ano))
+        return meses[mes - 1] if meses is not None and 1 <= mes <= 12 else 0
+
+    def serie(self, codigo, ano_inicial, ano_final):
+        """{(ano, mes): total} dos anos pedidos (meses sem produção ficam de fora)."""
+        self.atualizar()
+        totais = {}
+        for ano in range(ano_inicial, ano_final + 1):
+            meses = self.producao.get((codigo, ano))
+            if meses is None: continue
+            for i, total in enumerate(meses):
+                if total: totais[(ano, i + 1)] = total
+        return totais
+
+    def classificado(self, codigo):
+        self.atualizar()
+        return codigo in self.classificados
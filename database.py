@@ -1,5 +1,10 @@
 import sqlite3
 import os
+import time
+import threading
+from pathlib import Path
+from flask import g, has_app_context, current_app
+from busca import remover_acentos
 
 # Configuração de Caminhos (ajustado para garantir caminho absoluto relativo ao arquivo)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -10,16 +15,276 @@ DB_MEDICOS = os.path.join(DB_FOLDER, 'medicos.db')
 DB_AMB = os.path.join(DB_FOLDER, 'amb.db')
 DB_CADASTRO = os.path.join(DB_FOLDER, 'cadastro.db')
 
-geral_bp = Blueprint('geral', __name__)
+# Pragmas aplicados uma única vez, na abertura de cada conexão.
+# WAL permite leituras concorrentes com escrita (evita 'database is locked' durante uploads).
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",      # ~16 MB por conexão
+    "PRAGMA mmap_size = 134217728",    # 128 MB
+    "PRAGMA temp_store = MEMORY",
+)
 
-def get_db_connection(db_path):
-    if not os.path.exists(db_path):
-        print(f"AVISO: Banco de dados não encontrado em {db_path}")
-    conn = sqlite3.connect(db_path)
+# Conexão analítica: os quatro bancos anexados (somente leitura) sob nomes de schema estáveis
+SCHEMAS_ANALITICOS = {
+    'cir': DB_PRODUCAO,
+    'med': DB_MEDICOS,
+    'amb': DB_AMB,
+    'cad': DB_CADASTRO,
+}
+CHAVE_ANALITICA = 'analitico'
+
+def _chave_especialidade(expr):
+    # upper() do SQLite só converte ASCII ('Pediátrica' -> 'PEDIáTRICA'): tira os acentos antes
+    return f"upper(remover_acentos(trim({expr})))"
+
+
+# Views temporárias criadas na conexão analítica (joins entre bancos executados pelo SQLite).
+# Especialidades casam pela chave sem acentos e em maiúsculas (_chave_especialidade).
+VIEWS_ANALITICAS = {
+    'v_medicos_especialidade': f"""
+        SELECT {_chave_especialidade('especialidade')} AS especialidade,
+               count(*) AS medicos,
+               sum(trim(ativo) = '1') AS medicos_ativos
+        FROM med.medicos
+        WHERE trim(coalesce(especialidade, '')) <> ''
+        GROUP BY 1
+    """,
+    'v_producao_cirurgica_especialidade': f"""
+        SELECT {_chave_especialidade('f.especialidade')} AS especialidade, f.ano,
+               sum(f.quantidade) AS quantidade,
+               sum(f.quantidade * coalesce(pr.valor_sigtap, 0)) AS valor_produzido
+        FROM cir.producao_fato f
+        LEFT JOIN cir.procedimentos pr ON pr.codigo_sigtap = f.codigo_sigtap
+        WHERE trim(f.especialidade) <> ''
+        GROUP BY 1, 2
+    """,
+    # Médicos por especialidade x produção cirúrgica, uma linha por especialidade e ano com produção
+    # (filtrar por ano); especialidades só com médicos aparecem em todos os anos, com produção 0
+    'v_especialidade_medicos_producao': """
+        WITH anos AS (SELECT DISTINCT ano FROM v_producao_cirurgica_especialidade),
+             chaves AS (SELECT m.especialidade, anos.ano FROM v_medicos_especialidade m, anos
+                        UNION SELECT especialidade, ano FROM v_producao_cirurgica_especialidade)
+        SELECT k.especialidade, k.ano,
+               coalesce(m.medicos, 0) AS medicos,
+               coalesce(m.medicos_ativos, 0) AS medicos_ativos,
+               coalesce(p.quantidade, 0) AS quantidade_cirurgica,
+               coalesce(p.valor_produzido, 0) AS valor_produzido
+        FROM chaves k
+        LEFT JOIN v_medicos_especialidade m ON m.especialidade = k.especialidade
+        LEFT JOIN v_producao_cirurgica_especialidade p ON p.especialidade = k.especialidade AND p.ano = k.ano
+    """,
+    # Casamento contrato x especialidade SIRESP pelo nome do serviço contratado (especialidade vazia
+    # casaria com todo contrato: fica de fora)
+    'v_contratos_realizado': f"""
+        SELECT c.id AS contrato_id, e.razao_social, c.servico,
+               c.quantidade AS quantidade_contratada,
+               c.quantidade * coalesce(c.valor_unitario, 0) AS valor_contratado,
+               a.ano, a.mes,
+               coalesce(sum(a.realizado), 0) AS realizado
+        FROM cad.contratos c
+        JOIN cad.empresas e ON e.empresa_id = c.empresa_id
+        LEFT JOIN amb.producao_amb a
+               ON trim(coalesce(a.especialidade, '')) <> ''
+              AND instr({_chave_especialidade('c.servico')}, {_chave_especialidade('a.especialidade')}) > 0
+        WHERE c.ativo = 1
+        GROUP BY c.id, a.ano, a.mes
+    """,
+}
+
+# Caminho de leitura dos dashboards (app.config['DB_MODO_LEITURA']):
+#   'transacao' - conexão dedicada com uma transação de leitura fixada por request (snapshot do WAL)
+#   'copia'     - cópias do banco geradas periodicamente com a API de backup do sqlite3
+MODO_LEITURA_PADRAO = 'transacao'
+SNAPSHOT_FOLDER = os.path.join(DB_FOLDER, 'snapshots')
+SNAPSHOT_TTL = 60  # segundos até a cópia ser regerada (app.config['DB_SNAPSHOT_TTL'])
+
+POOL_MAX_POR_THREAD = 2  # conexões ociosas guardadas por banco em cada thread
+
+_pool = threading.local()
+_avisados = set()
+_snapshots = {}  # db_path -> (gerado_em, caminho da cópia)
+_snapshot_lock = threading.Lock()
+_vigias = {}  # db_path -> conexão usada só para ler PRAGMA data_version
+_vigias_lock = threading.Lock()
+
+
+class ConexaoPool(sqlite3.Connection):
+    """
+    Conexão devolvida ao pool no teardown do app context.
+    O close() chamado pelas rotas vira no-op enquanto a conexão pertence ao request;
+    o fechamento real é feito por fechar().
+    """
+    emprestada = False
+    reutilizavel = True
+
+    def close(self):
+        if self.emprestada: return
+        super().close()
+
+    def fechar(self):
+        self.emprestada = False
+        super().close()
+
+
+def _abrir_conexao(db_path):
+    if db_path not in _avisados:
+        _avisados.add(db_path)
+        if not os.path.exists(db_path):
+            print(f"AVISO: Banco de dados não encontrado em {db_path}")
+    conn = sqlite3.connect(db_path, factory=ConexaoPool)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _abrir_analitica():
+    """Conexão somente leitura com os quatro bancos anexados e as views cruzadas."""
+    conn = sqlite3.connect(':memory:', uri=True, factory=ConexaoPool)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.create_function('remover_acentos', 1, lambda t: remover_acentos(t) if isinstance(t, str) else t, deterministic=True)
+    for schema, db_path in SCHEMAS_ANALITICOS.items():
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"{Path(db_path).as_uri()}?mode=ro",))
+        conn.execute(f"PRAGMA {schema}.cache_size = -16000")
+        conn.execute(f"PRAGMA {schema}.mmap_size = 134217728")
+    for nome, sql in VIEWS_ANALITICAS.items():
+        conn.execute(f"CREATE TEMP VIEW {nome} AS {sql}")
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+def _gerar_snapshot(db_path):
+    """Copia o banco com a API de backup (leitura consistente) para um arquivo novo em SNAPSHOT_FOLDER."""
+    os.makedirs(SNAPSHOT_FOLDER, exist_ok=True)
+    nome = Path(db_path).stem
+    destino = os.path.join(SNAPSHOT_FOLDER, f"{nome}-{time.time_ns()}.db")
+    origem = sqlite3.connect(f"{Path(db_path).as_uri()}?mode=ro", uri=True)
+    copia = sqlite3.connect(destino)
+    try:
+        origem.backup(copia)
+    finally:
+        origem.close()
+        copia.close()
+    # Remove gerações antigas (mantém a anterior, que pode estar aberta por requests em curso)
+    manter = {destino, _snapshots.get(db_path, (0, None))[1]}
+    for arquivo in Path(SNAPSHOT_FOLDER).glob(f"{nome}-*.db"):
+        if str(arquivo) not in manter:
+            try: arquivo.unlink()
+            except OSError: pass
+    return destino
+
+
+def snapshot_atual(db_path, ttl=SNAPSHOT_TTL):
+    """Caminho da cópia mais recente do banco, regerada quando tem mais de `ttl` segundos."""
+    with _snapshot_lock:
+        gerado_em, caminho = _snapshots.get(db_path, (0, None))
+        if caminho is None or time.monotonic() - gerado_em >= ttl:
+            caminho = _gerar_snapshot(db_path)
+            _snapshots[db_path] = (time.monotonic(), caminho)
+        return caminho
+
+
+def _abrir_snapshot(caminho):
+    # immutable=1: a cópia nunca é alterada, então o SQLite dispensa locks e verificação de mudanças
+    conn = sqlite3.connect(f"{Path(caminho).as_uri()}?mode=ro&immutable=1", uri=True, factory=ConexaoPool)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA mmap_size = 134217728")
+    conn.reutilizavel = False
     return conn
 
+
+def _abrir_leitura(db_path):
+    conn = _abrir_conexao(db_path)
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+def _livres(chave):
+    if not hasattr(_pool, 'livres'): _pool.livres = {}
+    return _pool.livres.setdefault(chave, [])
+
+
+def _emprestar(chave, abrir):
+    # Fora de um app context (scripts de setup, CLI) a conexão é avulsa e fechada pelo chamador
+    if not has_app_context():
+        return abrir()
+
+    conexoes = g.setdefault('_conexoes_db', {})
+    conn = conexoes.get(chave)
+    if conn is None:
+        livres = _livres(chave)
+        conn = livres.pop() if livres else abrir()
+        conn.emprestada = True
+        conexoes[chave] = conn
+    return conn
+
+
+def get_db_connection(db_path):
+    return _emprestar(db_path, lambda: _abrir_conexao(db_path))
+
+
+def get_analitico_conn():
+    return _emprestar(CHAVE_ANALITICA, _abrir_analitica)
+
+
+def get_leitura_conn(db_path):
+    """
+    Conexão somente leitura para dashboards e relatórios: todas as consultas do request
+    enxergam o mesmo estado do banco e nunca bloqueiam (nem veem pela metade) uma escrita em curso.
+    """
+    config = current_app.config if has_app_context() else {}
+    if config.get('DB_MODO_LEITURA', MODO_LEITURA_PADRAO) == 'copia':
+        caminho = snapshot_atual(db_path, config.get('DB_SNAPSHOT_TTL', SNAPSHOT_TTL))
+        return _emprestar(('copia', db_path), lambda: _abrir_snapshot(caminho))
+    conn = _emprestar(('leitura', db_path), lambda: _abrir_leitura(db_path))
+    if not conn.in_transaction:
+        # Fixa o snapshot do WAL para o restante do request (liberado no teardown)
+        conn.execute("BEGIN")
+        conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+    return conn
+
+
+def devolver_conexoes(exc=None):
+    """Teardown do app context: descarta transações pendentes e devolve as conexões ao pool da thread."""
+    conexoes = g.pop('_conexoes_db', None)
+    if not conexoes: return
+    for chave, conn in conexoes.items():
+        try:
+            if conn.in_transaction: conn.rollback()
+            livres = _livres(chave)
+            if conn.reutilizavel and len(livres) < POOL_MAX_POR_THREAD:
+                livres.append(conn)
+            else:
+                conn.fechar()
+        except sqlite3.Error:
+            conn.fechar()
+
+
+def versao_dados(db_path):
+    """
+    PRAGMA data_version de uma conexão dedicada do processo: o valor muda sempre que outra conexão
+    (deste ou de outro processo) grava no banco. Serve de chave para caches de dados derivados.
+    """
+    with _vigias_lock:
+        conn = _vigias.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            _vigias[db_path] = conn
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def init_app(app):
+    app.teardown_appcontext(devolver_conexoes)
+
+
 def get_producao_conn(): return get_db_connection(DB_PRODUCAO)
 def get_medicos_conn(): return get_db_connection(DB_MEDICOS)
 def get_amb_conn(): return get_db_connection(DB_AMB)
-def get_cadastro_conn(): return get_db_connection(DB_CADASTRO)
\ No newline at end of file
+def get_cadastro_conn(): return get_db_connection(DB_CADASTRO)
+
+def get_amb_leitura_conn(): return get_leitura_conn(DB_AMB)
+def get_cadastro_leitura_conn(): return get_leitura_conn(DB_CADASTRO)
@@ -29,7 +29,7 @@ EXPORT_CONFIG = [
     # --- PRODUCAO_CIRURGICA.DB ---
     {
         'db': os.path.join(DB_FOLDER, 'producao_cirurgica.db'),
-        'tabela': 'producao',
+        'tabela': 'producao_anual',  # View: uma linha por código/especialidade/ano, meses em colunas
         'arquivo': 'producao_cirurgica.csv'
     },
 
@@ -87,9 +87,9 @@ def exportar_dados():
             # Conecta ao banco
             conn = sqlite3.connect(db_file)
 
-            # Verifica se a tabela existe antes de tentar ler
+            # Verifica se a tabela (ou view) existe antes de tentar ler
             cursor = conn.cursor()
-            cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{tabela}';")
+            cursor.execute(f"SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name='{tabela}';")
             if not cursor.fetchone():
                 print(f"[PULADO] Tabela '{tabela}' não existe no banco '{os.path.basename(db_file)}'.")
                 conn.close()
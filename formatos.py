@@ -0,0 +1,137 @@
+"""
+Detecção do formato de planilhas pelos primeiros bytes (assinatura), sem tentativa e erro.
+
+Os relatórios do SIRESP chegam como ".xls" que na verdade são tabelas HTML; tentar read_excel
+primeiro e cair no read_html na exceção custa um parse completo desperdiçado por arquivo. Aqui o
+arquivo é classificado uma vez (xls OLE2, xlsx zip, HTML ou texto delimitado, com encoding e
+separador) e lido direto pelo parser certo.
+
+Uso:  python formatos.py [arquivos...]   (benchmark contra a leitura antiga; padrão: uploads/)
+"""
+
+import codecs
+import csv
+import io
+import os
+import sys
+import time
+from collections import namedtuple
+
+AMOSTRA_BYTES = 8 * 1024
+
+ASSINATURA_OLE2 = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+ASSINATURA_ZIP = b'PK\x03\x04'
+ASSINATURA_PDF = b'%PDF'
+MARCAS_HTML = (b'<html', b'<table', b'<!doctype html', b'<head', b'<body', b'<meta', b'<?xml')
+
+# tipo: 'xls', 'xlsx', 'html', 'texto', 'pdf' ou 'desconhecido'
+Formato = namedtuple('Formato', 'tipo encoding separador')
+
+
+class FormatoNaoSuportado(Exception):
+    """Arquivo que não é planilha (PDF, binário desconhecido)."""
+
+
+def detectar_formato_csv(amostra):
+    """(encoding, separador) a partir dos primeiros bytes do arquivo, sem reler o arquivo inteiro."""
+    encoding = 'cp1252'
+    for candidato in ('utf-8-sig', 'cp1252'):
+        try:
+            # decoder incremental: a amostra pode terminar no meio de um caractere multibyte
+            texto = codecs.getincrementaldecoder(candidato)().decode(amostra, final=False)
+            encoding = candidato
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        texto = amostra.decode('latin-1')
+        encoding = 'latin-1'
+    try:
+        separador = csv.Sniffer().sniff(texto.split('\n', 1)[0], delimiters=';,\t').delimiter
+    except csv.Error:
+        separador = ';'
+    return encoding, separador
+
+
+def detectar_formato(caminho):
+    """Classifica o arquivo pela assinatura dos primeiros AMOSTRA_BYTES."""
+    with open(caminho, 'rb') as f: amostra = f.read(AMOSTRA_BYTES)
+    if amostra.startswith(ASSINATURA_OLE2): return Formato('xls', None, None)
+    if amostra.startswith(ASSINATURA_ZIP): return Formato('xlsx', None, None)
+    if amostra.startswith(ASSINATURA_PDF): return Formato('pdf', None, None)
+    inicio = amostra.lstrip(codecs.BOM_UTF8).lstrip()[:1024].lower()
+    if inicio.startswith(b'<') and any(m in inicio for m in MARCAS_HTML):
+        return Formato('html', None, None)
+    if b'\x00' in amostra: return Formato('desconhecido', None, None)
+    return Formato('texto', *detectar_formato_csv(amostra))
+
+
+def ler_tabela(caminho, header=0, formato=None):
+    """
+    DataFrame do arquivo, lido direto pelo parser do formato detectado. HTML devolve a primeira
+    tabela da página; texto usa o encoding e o separador detectados (linhas de tamanhos diferentes,
+    como os metadados no topo dos relatórios, são completadas com vazio).
+    """
+    import pandas as pd
+    formato = formato or detectar_formato(caminho)
+    if formato.tipo in ('xls', 'xlsx'):
+        return pd.read_excel(caminho, header=header)
+    if formato.tipo == 'html':
+        return pd.read_html(caminho, decimal=',', thousands='.', header=header)[0]
+    if formato.tipo == 'texto':
+        with open(caminho, encoding=formato.encoding, errors='replace', newline='') as f: texto = f.read()
+        colunas = max((len(l) for l in csv.reader(io.StringIO(texto[:AMOSTRA_BYTES * 4]), delimiter=formato.separador)), default=1)
+        df = pd.read_csv(io.StringIO(texto), sep=formato.separador, header=None, names=range(colunas))
+        return df if header is None else _aplicar_cabecalho(df, header)
+    raise FormatoNaoSuportado(f"Formato não suportado: {formato.tipo}")
+
+
+def _aplicar_cabecalho(df, header):
+    cabecalho = df.iloc[header]
+    df = df.iloc[header + 1:].reset_index(drop=True)
+    df.columns = [c if isinstance(c, str) else f'Unnamed: {i}' for i, c in enumerate(cabecalho)]
+    return df
+
+
+def _ler_por_tentativa(caminho):
+    # Leitura antiga (rotas e siresp_bot), mantida só para o benchmark
+    import pandas as pd
+    try:
+        return pd.read_excel(caminho, header=None)
+    except Exception:
+        try:
+            return pd.read_html(caminho, decimal=',', thousands='.', header=None)[0]
+        except Exception:
+            try:
+                return pd.read_csv(caminho, header=None, sep=';', encoding='latin1')
+            except Exception:
+                return pd.read_csv(caminho, header=None, sep=',', encoding='latin1')
+
+
+def benchmark(caminhos, repeticoes=5):
+    print(f"{'arquivo':<60} {'formato':<8} {'tentativa':>11} {'detecção':>10} {'ganho':>7}")
+    for caminho in caminhos:
+        formato = detectar_formato(caminho)
+        nome = os.path.basename(caminho)[:60]
+        if formato.tipo in ('pdf', 'desconhecido'):
+            print(f"{nome:<60} {formato.tipo:<8} {'-':>11} {'-':>10} {'-':>7}")
+            continue
+        tempos = []
+        for funcao in (_ler_por_tentativa, lambda c: ler_tabela(c, header=None)):
+            inicio = time.perf_counter()
+            try:
+                for _ in range(repeticoes): funcao(caminho)
+            except Exception:
+                tempos.append(None)
+                continue
+            tempos.append((time.perf_counter() - inicio) / repeticoes * 1000)
+        antigo, novo = tempos
+        fmt = lambda t: f"{t:9.1f}ms" if t is not None else f"{'falha':>11}"
+        ganho = f"{antigo / novo:6.1f}x" if antigo and novo else f"{'-':>7}"
+        print(f"{nome:<60} {formato.tipo:<8} {fmt(antigo):>11} {fmt(novo):>10} {ganho}")
+
+
+if __name__ == '__main__':
+    pasta = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    arquivos = sys.argv[1:] or sorted(os.path.join(pasta, n) for n in os.listdir(pasta))
+    benchmark([a for a in arquivos if os.path.isfile(a)])
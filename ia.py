@@ -0,0 +1,174 @@
+"""
+Análises de IA (Gemini) executadas em segundo plano.
+
+A chamada ao modelo pode levar dezenas de segundos; feita no thread do request, prende um worker do
+servidor. Aqui cada análise vira um job num pool limitado de threads, que usa uma requests.Session
+compartilhada (keep-alive), timeouts de conexão/leitura e um disjuntor: depois de falhas seguidas o
+serviço é dado como indisponível por um tempo e os pedidos falham na hora. O cliente recebe o id do
+job e consulta o andamento; resultados ficam em cache pelo hash do prompt.
+
+GEMINI_BASE_URL permite apontar para um servidor local (stub) em testes.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from cache import CacheLRU
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip('/')
+GEMINI_MODELO = os.getenv("GEMINI_MODELO", "gemini-2.5-flash-preview-09-2025")
+IA_WORKERS = int(os.getenv('IA_WORKERS', 2))
+IA_FILA_MAXIMA = int(os.getenv('IA_FILA_MAXIMA', IA_WORKERS * 8))  # jobs aguardando um worker
+IA_TIMEOUT = (5, float(os.getenv('IA_TIMEOUT', 60)))  # (conexão, leitura) em segundos
+DISJUNTOR_FALHAS = 3
+DISJUNTOR_ESPERA = 60  # segundos com o circuito aberto antes de tentar de novo
+
+_executor = ThreadPoolExecutor(max_workers=IA_WORKERS, thread_name_prefix='ia')
+_vagas = threading.BoundedSemaphore(IA_WORKERS + IA_FILA_MAXIMA)
+_sessao = requests.Session()
+_sessao.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=IA_WORKERS))
+_sessao.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=IA_WORKERS))
+
+resultados_cache = CacheLRU(maximo=256, ttl=24 * 3600)  # hash do prompt -> texto
+jobs = CacheLRU(maximo=1024, ttl=3600)                  # id do job -> estado
+_em_andamento = {}                                      # hash do prompt -> id do job pendente
+_lock = threading.Lock()
+
+
+class IAIndisponivel(Exception):
+    """Serviço sem configuração, circuito aberto ou fila cheia; o cliente deve tentar mais tarde."""
+
+
+class _Disjuntor:
+    """
+    Fechado: tudo passa. Aberto: tudo é recusado até aberto_ate. Meio-aberto (espera vencida): uma
+    única chamada de teste passa; as demais são recusadas até ela terminar, e o resultado dela fecha
+    o circuito ou o abre de novo por mais `espera` segundos.
+    """
+    def __init__(self, falhas_max=DISJUNTOR_FALHAS, espera=DISJUNTOR_ESPERA):
+        self._lock = threading.Lock()
+        self.falhas_max, self.espera = falhas_max, espera
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self.em_teste = False
+
+    def aberto(self):
+        # Recusa pedidos novos só enquanto a espera não venceu; no meio-aberto eles podem entrar
+        # na fila, e é permitir() que decide qual deles chama o modelo
+        return time.monotonic() < self.aberto_ate
+
+    def permitir(self):
+        """True se a chamada ao modelo pode ser feita agora (no meio-aberto, só a chamada de teste)."""
+        with self._lock:
+            if self.falhas < self.falhas_max: return True
+            if self.em_teste or time.monotonic() < self.aberto_ate: return False
+            self.em_teste = True
+            return True
+
+    def sucesso(self):
+        with self._lock: self.falhas, self.aberto_ate, self.em_teste = 0, 0.0, False
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.falhas >= self.falhas_max: self.aberto_ate = time.monotonic() + self.espera
+            self.em_teste = False
+
+    def estado(self):
+        with self._lock:
+            restante = self.aberto_ate - time.monotonic()
+            if self.falhas < self.falhas_max: situacao = 'fechado'
+            elif restante > 0: situacao = 'aberto'
+            else: situacao = 'meio-aberto'
+            return {'estado': situacao, 'aberto': restante > 0, 'em_teste': self.em_teste,
+                    'falhas_seguidas': self.falhas, 'reabre_em_s': max(0, round(restante))}
+
+
+disjuntor = _Disjuntor()
+
+
+def configurado():
+    # Sem chave só faz sentido quando a URL foi trocada (servidor local de testes)
+    return bool(GEMINI_API_KEY) or 'generativelanguage.googleapis.com' not in GEMINI_BASE_URL
+
+
+def gerar_texto(prompt):
+    """Chamada síncrona ao modelo; usada pelos workers."""
+    url = f"{GEMINI_BASE_URL}/models/{GEMINI_MODELO}:generateContent"
+    # Chave no cabeçalho (não na URL), para não aparecer em logs nem em mensagens de erro
+    res = _sessao.post(url, headers={'x-goog-api-key': GEMINI_API_KEY} if GEMINI_API_KEY else None,
+                       json={"contents": [{"parts": [{"text": prompt}]}]}, timeout=IA_TIMEOUT)
+    res.raise_for_status()
+    return res.json()['candidates'][0]['content']['parts'][0]['text']
+
+
+def chave_prompt(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def _executar(job_id, chave, prompt):
+    try:
+        job = jobs.obter(job_id)
+        if job is not None: job['estado'] = 'executando'
+        if not disjuntor.permitir(): raise IAIndisponivel('Serviço de IA indisponível no momento. Tente novamente mais tarde.')
+        try:
+            texto = gerar_texto(prompt)
+        except Exception:
+            disjuntor.falha()
+            raise
+        disjuntor.sucesso()
+        resultados_cache.guardar(chave, texto)
+        jobs.guardar(job_id, {'id': job_id, 'estado': 'concluido', 'markdown': texto})
+    except IAIndisponivel as e:
+        jobs.guardar(job_id, {'id': job_id, 'estado': 'erro', 'error': str(e)})
+    except requests.Timeout:
+        jobs.guardar(job_id, {'id': job_id, 'estado': 'erro', 'error': 'O serviço de IA não respondeu a tempo.'})
+    except requests.HTTPError as e:
+        jobs.guardar(job_id, {'id': job_id, 'estado': 'erro', 'error': f'O serviço de IA respondeu com erro {e.response.status_code}.'})
+    except Exception as e:
+        jobs.guardar(job_id, {'id': job_id, 'estado': 'erro', 'error': f'Falha na análise: {type(e).__name__}'})
+    finally:
+        with _lock: _em_andamento.pop(chave, None)
+        _vagas.release()
+
+
+def enviar_analise(prompt):
+    """
+    Agenda a análise do prompt e devolve o job. Prompt já analisado volta concluído na hora;
+    prompt idêntico a um job pendente devolve o mesmo job.
+    """
+    if not configurado(): raise IAIndisponivel('Sem chave API')
+    chave = chave_prompt(prompt)
+    texto = resultados_cache.obter(chave)
+    if texto is not None:
+        job_id = uuid.uuid4().hex
+        return jobs.guardar(job_id, {'id': job_id, 'estado': 'concluido', 'markdown': texto, 'cache': True})
+    with _lock:
+        pendente = jobs.obter(_em_andamento.get(chave))
+        if pendente is not None: return pendente
+        if disjuntor.aberto(): raise IAIndisponivel('Serviço de IA indisponível no momento. Tente novamente mais tarde.')
+        if not _vagas.acquire(blocking=False): raise IAIndisponivel('Muitas análises em andamento. Tente novamente em alguns segundos.')
+        job_id = uuid.uuid4().hex
+        job = jobs.guardar(job_id, {'id': job_id, 'estado': 'pendente'})
+        _em_andamento[chave] = job_id
+    try:
+        _executor.submit(_executar, job_id, chave, prompt)
+    except RuntimeError:
+        with _lock: _em_andamento.pop(chave, None)
+        _vagas.release()
+        raise IAIndisponivel('Serviço de IA indisponível no momento.')
+    return job
+
+
+def obter_job(job_id):
+    return jobs.obter(job_id)
+
+
+def resumo():
+    return {'workers': IA_WORKERS, 'fila_maxima': IA_FILA_MAXIMA, 'em_andamento': len(_em_andamento),
+            'disjuntor': disjuntor.estado(), 'cache': resultados_cache.estatisticas()}
@@ -0,0 +1,251 @@
+"""
+Importação em massa de médicos (CSV ou XLSX) sem tirar a tabela do ar.
+
+As linhas são lidas em streaming, validadas e gravadas em lotes (executemany, uma transação
+por lote). Médicos já cadastrados são localizados pelo CRM ou, na falta dele, pelo CPF e
+só têm atualizados os campos preenchidos no arquivo; os demais são inseridos.
+
+Uso:  python importacao_medicos.py arquivo.csv|arquivo.xlsx [tamanho_lote]
+"""
+
+import csv
+import io
+import os
+import re
+import sys
+from datetime import date, datetime
+from database import DB_MEDICOS, get_db_connection
+from busca import remover_acentos
+from formatos import detectar_formato_csv
+
+COLUNAS_MEDICO = [
+    'nome', 'crm', 'dn', 'especialidade', 'nacionalidade', 'naturalidade', 'estado_natural',
+    'tel_ddd', 'tel_cel', 'email', 'cpf', 'rg', 'cep_res', 'end_res',
+    'num_res', 'comp_res', 'bairro_res', 'cidade_res', 'estado_res',
+    'ativo', 'inicio_ativ', 'fim_ativ', 'sexo'
+]
+PADROES = {'ativo': '1', 'sexo': '0'}
+TAMANHO_LOTE = 500
+AMOSTRA_BYTES = 64 * 1024
+MAX_ERROS_RELATADOS = 50
+
+
+def normalizar_texto(texto):
+    """Remove acentos e caracteres especiais para nomes de colunas."""
+    if not isinstance(texto, str): return str(texto)
+    sem_acento = remover_acentos(texto)
+    return re.sub(r'[^\w]', '', sem_acento.lower().strip().replace(' ', '_'))
+
+
+def mapear_coluna(col):
+    """Nome de coluna da planilha -> campo de `medicos` (ou None)."""
+    col_norm = normalizar_texto(col)
+    if 'nome' in col_norm: return 'nome'
+    elif 'crm' in col_norm: return 'crm'
+    elif 'nasc' in col_norm or col_norm == 'dn': return 'dn'
+    elif 'especialidade' in col_norm: return 'especialidade'
+    elif 'nacionalidade' in col_norm or 'pais' in col_norm: return 'nacionalidade'
+    elif 'naturalidade' in col_norm and 'estado' not in col_norm: return 'naturalidade'
+    elif 'estado_natural' in col_norm or ('uf' in col_norm and 'nasc' in col_norm): return 'estado_natural'
+    elif 'ddd' in col_norm: return 'tel_ddd'
+    elif 'cel' in col_norm: return 'tel_cel'
+    elif 'email' in col_norm: return 'email'
+    elif 'cpf' in col_norm: return 'cpf'
+    elif 'rg' in col_norm: return 'rg'
+    elif 'cep' in col_norm: return 'cep_res'
+    elif 'endereco' in col_norm or 'end' in col_norm: return 'end_res'
+    elif 'num' in col_norm: return 'num_res'
+    elif 'comp' in col_norm: return 'comp_res'
+    elif 'bairro' in col_norm: return 'bairro_res'
+    elif 'cidade' in col_norm: return 'cidade_res'
+    elif 'estado' in col_norm or 'uf' in col_norm: return 'estado_res'
+    elif 'inicio' in col_norm: return 'inicio_ativ'
+    elif 'fim' in col_norm: return 'fim_ativ'
+    elif 'ativo' in col_norm: return 'ativo'
+    elif 'sexo' in col_norm: return 'sexo'
+    return None
+
+
+def mapear_cabecalho(cabecalho):
+    """{índice da coluna: campo}; se dois cabeçalhos caem no mesmo campo, vale o primeiro."""
+    mapa, usados = {}, set()
+    for i, col in enumerate(cabecalho):
+        campo = mapear_coluna(col) if col is not None else None
+        if campo and campo not in usados:
+            mapa[i] = campo
+            usados.add(campo)
+    return mapa
+
+
+def _texto_celula(valor):
+    if valor is None: return ''
+    if isinstance(valor, datetime): return valor.date().isoformat()
+    if isinstance(valor, date): return valor.isoformat()
+    if isinstance(valor, float) and valor.is_integer(): return str(int(valor))
+    return str(valor).strip()
+
+
+def ler_linhas(arquivo, nome_arquivo):
+    """Gera as linhas (listas de texto) de um CSV ou XLSX, cabeçalho primeiro. `arquivo` é binário."""
+    if nome_arquivo.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        planilha = load_workbook(arquivo, read_only=True, data_only=True).active
+        for linha in planilha.iter_rows(values_only=True):
+            yield [_texto_celula(v) for v in linha]
+        return
+    amostra = arquivo.read(AMOSTRA_BYTES)
+    arquivo.seek(0)
+    encoding, separador = detectar_formato_csv(amostra)
+    texto = io.TextIOWrapper(arquivo, encoding=encoding, errors='replace', newline='')
+    try:
+        for linha in csv.reader(texto, delimiter=separador):
+            yield [v.strip() for v in linha]
+    finally:
+        texto.detach()
+
+
+def so_digitos(valor):
+    return re.sub(r'\D', '', valor or '')
+
+
+def chave_crm(crm):
+    return re.sub(r'\W', '', (crm or '').upper())
+
+
+def _data_iso(valor):
+    if not valor: return ''
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try: return datetime.strptime(valor[:10], formato).date().isoformat()
+        except ValueError: continue
+    raise ValueError(f"data inválida: {valor}")
+
+
+def _sim_nao(valor, sim, nao):
+    v = normalizar_texto(valor)
+    if v in sim: return '1'
+    if v in nao: return '0'
+    return valor
+
+
+def validar_medico(registro):
+    """Normaliza um registro {campo: texto}. Lança ValueError se não puder ser importado."""
+    if not registro.get('nome'): raise ValueError("nome em branco")
+    if not chave_crm(registro.get('crm')) and not so_digitos(registro.get('cpf')):
+        raise ValueError("sem CRM nem CPF")
+    for campo in ('dn', 'inicio_ativ', 'fim_ativ'):
+        if campo in registro: registro[campo] = _data_iso(registro[campo])
+    if 'sexo' in registro:
+        registro['sexo'] = _sim_nao(registro['sexo'], {'1', 'f', 'fem', 'feminino'}, {'0', 'm', 'masc', 'masculino'})
+    if 'ativo' in registro:
+        registro['ativo'] = _sim_nao(registro['ativo'], {'1', 's', 'sim', 'true', 'ativo'}, {'0', 'n', 'nao', 'false', 'inativo'})
+    return registro
+
+
+class _IndiceMedicos:
+    """CRM/CPF -> id dos médicos existentes, carregado uma vez (duas colunas) no início da importação."""
+
+    def __init__(self, conn):
+        self.por_crm, self.por_cpf = {}, {}
+        for id, crm, cpf in conn.execute("SELECT id, crm, cpf FROM medicos ORDER BY id"):
+            self.registrar(id, crm, cpf)
+
+    def localizar(self, registro):
+        crm, cpf = chave_crm(registro.get('crm')), so_digitos(registro.get('cpf'))
+        if crm and crm in self.por_crm: return self.por_crm[crm]
+        if cpf and cpf in self.por_cpf: return self.por_cpf[cpf]
+        return None
+
+    def registrar(self, id, crm, cpf):
+        if chave_crm(crm): self.por_crm.setdefault(chave_crm(crm), id)
+        if so_digitos(cpf): self.por_cpf.setdefault(so_digitos(cpf), id)
+
+
+def _gravar_lote(conn, indice, campos, lote):
+    novos, atualizacoes = {}, []
+    for registro in lote:
+        id = indice.localizar(registro)
+        if id is not None:
+            atualizacoes.append((id, registro))
+            continue
+        # O mesmo médico repetido dentro do lote: funde as linhas (a última preenchida prevalece)
+        chave = chave_crm(registro.get('crm')) or 'cpf:' + so_digitos(registro.get('cpf'))
+        if chave in novos: novos[chave].update({c: v for c, v in registro.items() if v})
+        else: novos[chave] = registro
+    novos = list(novos.values())
+
+    # Atualiza só os campos presentes no arquivo e preenchidos (preserva edições manuais)
+    sets = ', '.join(f"{c} = coalesce(nullif(?, ''), {c})" for c in campos)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if atualizacoes:
+            conn.executemany(f"UPDATE medicos SET {sets} WHERE id = ?",
+                             [[r.get(c, '') for c in campos] + [id] for id, r in atualizacoes])
+        if novos:
+            ultimo_id = conn.execute("SELECT coalesce(max(id), 0) FROM medicos").fetchone()[0]
+            placeholders = ', '.join(['?'] * len(COLUNAS_MEDICO))
+            conn.executemany(f"INSERT INTO medicos ({', '.join(COLUNAS_MEDICO)}) VALUES ({placeholders})",
+                             [[r.get(c) or PADROES.get(c, '') for c in COLUNAS_MEDICO] for r in novos])
+            # executemany não devolve os ids: registra os novos para que repetições adiante virem atualização
+            for id, crm, cpf in conn.execute("SELECT id, crm, cpf FROM medicos WHERE id > ?", (ultimo_id,)):
+                indice.registrar(id, crm, cpf)
+    return len(novos), len(atualizacoes)
+
+
+def importar_medicos(conn, linhas, tamanho_lote=TAMANHO_LOTE):
+    """
+    Importa as linhas (cabeçalho primeiro) e gera o progresso a cada lote gravado:
+    {'lidos', 'inseridos', 'atualizados', 'invalidos', 'erros', 'concluido'}.
+    """
+    linhas = iter(linhas)
+    mapa = mapear_cabecalho(next(linhas, []))
+    if 'nome' not in mapa.values() or not {'crm', 'cpf'} & set(mapa.values()):
+        raise ValueError("Cabeçalho sem as colunas de nome e CRM/CPF.")
+    campos = [c for c in COLUNAS_MEDICO if c in mapa.values()]
+
+    indice = _IndiceMedicos(conn)
+    progresso = {'lidos': 0, 'inseridos': 0, 'atualizados': 0, 'invalidos': 0, 'erros': [], 'concluido': False}
+    lote = []
+    for numero, linha in enumerate(linhas, start=2):
+        if not any(linha): continue
+        progresso['lidos'] += 1
+        registro = {campo: linha[i] if i < len(linha) else '' for i, campo in mapa.items()}
+        try:
+            lote.append(validar_medico(registro))
+        except ValueError as e:
+            progresso['invalidos'] += 1
+            if len(progresso['erros']) < MAX_ERROS_RELATADOS:
+                progresso['erros'].append({'linha': numero, 'erro': str(e)})
+        if len(lote) >= tamanho_lote:
+            inseridos, atualizados = _gravar_lote(conn, indice, campos, lote)
+            progresso['inseridos'] += inseridos; progresso['atualizados'] += atualizados
+            lote = []
+            yield dict(progresso)
+    if lote:
+        inseridos, atualizados = _gravar_lote(conn, indice, campos, lote)
+        progresso['inseridos'] += inseridos; progresso['atualizados'] += atualizados
+    progresso['concluido'] = True
+    yield dict(progresso)
+
+
+def importar_arquivo(caminho, db_path=DB_MEDICOS, tamanho_lote=TAMANHO_LOTE, verbose=True):
+    from migrations import migrar
+    migrar('medicos', db_path, verbose=verbose)
+    conn = get_db_connection(db_path)
+    try:
+        with open(caminho, 'rb') as arquivo:
+            for progresso in importar_medicos(conn, ler_linhas(arquivo, caminho), tamanho_lote):
+                if verbose:
+                    print(f"{progresso['lidos']} lidos | {progresso['inseridos']} inseridos | "
+                          f"{progresso['atualizados']} atualizados | {progresso['invalidos']} inválidos")
+        for erro in progresso['erros'] if verbose else []:
+            print(f"  linha {erro['linha']}: {erro['erro']}")
+        return progresso
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or not os.path.exists(sys.argv[1]):
+        print(__doc__)
+        sys.exit(1)
+    importar_arquivo(sys.argv[1], tamanho_lote=int(sys.argv[2]) if len(sys.argv) > 2 else TAMANHO_LOTE)
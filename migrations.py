@@ -0,0 +1,618 @@
+"""
+Migrações versionadas dos bancos SQLite.
+
+Cada banco tem uma lista ordenada de (versão, descrição, passo). O passo é um script SQL
+ou uma função que recebe a conexão. A versão aplicada fica registrada na tabela
+schema_version do próprio banco; cada migração roda em uma única transação.
+
+Uso:  python migrations.py          (atualiza todos os bancos)
+      python migrations.py status   (mostra a versão de cada banco)
+"""
+
+import sqlite3
+import sys
+import os
+from datetime import date
+from pathlib import Path
+from database import DB_PRODUCAO, DB_MEDICOS, DB_AMB, DB_CADASTRO, get_db_connection
+
+BANCOS = {
+    'producao': DB_PRODUCAO,
+    'medicos': DB_MEDICOS,
+    'amb': DB_AMB,
+    'cadastro': DB_CADASTRO,
+}
+
+# Colunas mensais da antiga tabela horizontal de produção
+MESES_COLUNAS = ['jan', 'fev', 'mar', 'abr', 'mai', 'jun', 'jul', 'ago', 'set', 'out', 'nov', 'dez']
+
+
+def _sql_pivot_meses(coluna_mes='mes', coluna_qtd='quantidade'):
+    return ",\n".join(
+        f'sum(CASE WHEN {coluna_mes} = {i} THEN {coluna_qtd} ELSE 0 END) AS "{m}"'
+        for i, m in enumerate(MESES_COLUNAS, start=1))
+
+
+def _producao_formato_longo(conn):
+    """
+    Converte a tabela horizontal `producao` (uma linha por código/especialidade, meses em colunas,
+    sem ano) para o fato `producao_fato` em formato longo, e recria `producao` como view de
+    compatibilidade com o ano corrente.
+    A produção antiga não tem ano: é atribuída a ANO_PRODUCAO_LEGADA, que precisa ser informado
+    quando houver produção a converter (não há como deduzi-lo dos dados).
+    """
+    tem_legado = conn.execute(
+        "SELECT 1 FROM producao WHERE " + " OR ".join(f'coalesce("{m}", 0) <> 0' for m in MESES_COLUNAS) + " LIMIT 1").fetchone()
+    ano_legado = os.getenv('ANO_PRODUCAO_LEGADA', '').strip()
+    if tem_legado and not ano_legado.isdigit():
+        raise RuntimeError(
+            "A tabela `producao` tem produção mensal sem ano. Defina ANO_PRODUCAO_LEGADA com o ano a que "
+            "ela se refere (ex.: ANO_PRODUCAO_LEGADA=2025) e rode as migrações de novo (python migrations.py).")
+    ano_legado = int(ano_legado) if ano_legado.isdigit() else date.today().year
+    codigo_limpo = "trim(replace(codigo_sigtap, char(160), ''))"
+
+    conn.execute("""
+        CREATE TABLE producao_classificacao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo_sigtap TEXT NOT NULL,
+            especialidade TEXT NOT NULL DEFAULT '',
+            tipo TEXT,
+            UNIQUE (codigo_sigtap, especialidade)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE producao_fato (
+            codigo_sigtap TEXT NOT NULL,
+            ano INTEGER NOT NULL,
+            mes INTEGER NOT NULL CHECK (mes BETWEEN 1 AND 12),
+            especialidade TEXT NOT NULL DEFAULT '',
+            quantidade REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (codigo_sigtap, ano, mes, especialidade)
+        ) WITHOUT ROWID
+    """)
+    # Cobre as varreduras por período (todas as colunas lidas estão no índice)
+    conn.execute("CREATE INDEX idx_producao_fato_periodo ON producao_fato (ano, mes, especialidade, codigo_sigtap, quantidade)")
+
+    # Mesma limpeza nos códigos do cadastro: os que vieram com NBSP deixariam de casar com a produção
+    conn.execute(f"UPDATE procedimentos SET codigo_sigtap = {codigo_limpo} WHERE codigo_sigtap IS NOT {codigo_limpo}")
+    conn.execute(f"""
+        INSERT OR IGNORE INTO producao_classificacao (codigo_sigtap, especialidade, tipo)
+        SELECT {codigo_limpo}, coalesce(especialidade, ''), tipo FROM producao ORDER BY id
+    """)
+    meses_union = "\nUNION ALL ".join(
+        f'SELECT {codigo_limpo} AS codigo, {i} AS mes, coalesce(especialidade, \'\') AS esp, "{m}" AS qtd FROM producao'
+        for i, m in enumerate(MESES_COLUNAS, start=1))
+    conn.execute(f"""
+        INSERT INTO producao_fato (codigo_sigtap, ano, mes, especialidade, quantidade)
+        SELECT codigo, ?, mes, esp, sum(qtd)
+        FROM ({meses_union})
+        WHERE qtd IS NOT NULL AND qtd <> 0
+        GROUP BY codigo, mes, esp
+    """, (ano_legado,))
+    conn.execute("DROP TABLE producao")
+
+    conn.execute(f"""
+        CREATE VIEW producao_anual AS
+        SELECT f.codigo_sigtap, f.ano, f.especialidade, c.tipo,
+               {_sql_pivot_meses('f.mes', 'f.quantidade')}
+        FROM producao_fato f
+        LEFT JOIN producao_classificacao c
+               ON c.codigo_sigtap = f.codigo_sigtap AND c.especialidade = f.especialidade
+        GROUP BY f.codigo_sigtap, f.ano, f.especialidade
+    """)
+    meses_compat = ", ".join(f'coalesce(a."{m}", 0) AS "{m}"' for m in MESES_COLUNAS)
+    conn.execute(f"""
+        CREATE VIEW producao AS
+        SELECT c.id, c.codigo_sigtap, c.tipo, c.especialidade, {meses_compat}
+        FROM producao_classificacao c
+        LEFT JOIN producao_anual a
+               ON a.codigo_sigtap = c.codigo_sigtap AND a.especialidade = c.especialidade
+              AND a.ano = CAST(strftime('%Y', 'now', 'localtime') AS INTEGER)
+    """)
+    conn.execute("ANALYZE")
+
+
+def _sql_so_digitos(expr):
+    for c in ('.', '-', '/', ' '):
+        expr = f"replace({expr}, '{c}', '')"
+    return f"replace({expr}, char(160), '')"
+
+
+def _procedimentos_busca(conn):
+    """
+    Recria `procedimentos` com id INTEGER PRIMARY KEY (rowid estável para o índice) e cria
+    `procedimentos_busca` (FTS5): nome com acentos removidos pelo tokenizer e código SIGTAP
+    só com dígitos, para casar '04.01.01.005-8' e '0401010058'. Mantido por triggers.
+    """
+    conn.execute("""
+        CREATE TABLE procedimentos_novo (
+            id INTEGER PRIMARY KEY,
+            nome TEXT,
+            codigo_sigtap TEXT,
+            valor_sigtap REAL
+        )
+    """)
+    conn.execute("INSERT INTO procedimentos_novo (nome, codigo_sigtap, valor_sigtap) SELECT nome, codigo_sigtap, valor_sigtap FROM procedimentos ORDER BY rowid")
+    conn.execute("DROP TABLE procedimentos")
+    conn.execute("ALTER TABLE procedimentos_novo RENAME TO procedimentos")
+    conn.execute("CREATE INDEX idx_procedimentos_codigo ON procedimentos (codigo_sigtap)")
+    conn.execute("CREATE INDEX idx_procedimentos_nome ON procedimentos (nome)")
+
+    conn.execute("""
+        CREATE VIRTUAL TABLE procedimentos_busca USING fts5(
+            nome, codigo,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+    """)
+    codigo = lambda p: _sql_so_digitos(f"coalesce({p}codigo_sigtap, '')")
+    conn.execute(f"INSERT INTO procedimentos_busca (rowid, nome, codigo) SELECT id, nome, {codigo('')} FROM procedimentos")
+    conn.execute(f"""
+        CREATE TRIGGER trg_procedimentos_busca_insert AFTER INSERT ON procedimentos BEGIN
+            INSERT INTO procedimentos_busca (rowid, nome, codigo) VALUES (NEW.id, NEW.nome, {codigo('NEW.')});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_procedimentos_busca_update AFTER UPDATE OF nome, codigo_sigtap ON procedimentos BEGIN
+            DELETE FROM procedimentos_busca WHERE rowid = OLD.id;
+            INSERT INTO procedimentos_busca (rowid, nome, codigo) VALUES (NEW.id, NEW.nome, {codigo('NEW.')});
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER trg_procedimentos_busca_delete AFTER DELETE ON procedimentos BEGIN
+            DELETE FROM procedimentos_busca WHERE rowid = OLD.id;
+        END
+    """)
+
+
+def vigiar_tabela_cadastro(conn, tabela):
+    """
+    Cria (se faltarem) os triggers que contam em catalogo_sequencia.cadastro cada alteração de uma
+    tabela de referência do catálogo, e já conta uma. Chamada também depois que setup_db recria a
+    tabela com to_sql(if_exists='replace'), que descarta os triggers junto com a tabela antiga.
+    """
+    for evento in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_catalogo_{evento.lower()} AFTER {evento} ON {tabela} BEGIN
+                UPDATE catalogo_sequencia SET cadastro = cadastro + 1 WHERE id = 1;
+            END
+        """)
+    conn.execute("UPDATE catalogo_sequencia SET cadastro = cadastro + 1 WHERE id = 1")
+
+
+def _catalogo_sequencia(conn):
+    """
+    Contadores mantidos por triggers para o catálogo em memória (catalogo.py): `cadastro` muda a
+    cada alteração de procedimentos, classificações, especialidades ou tipo_cma; `producao` muda a
+    cada alteração de producao_fato, e producao_fato_alteracoes guarda em que valor dele cada
+    célula (código, ano, mês) mudou pela última vez, para o catálogo reler só essas células.
+    """
+    conn.execute("""
+        CREATE TABLE catalogo_sequencia (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            cadastro INTEGER NOT NULL,
+            producao INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT INTO catalogo_sequencia (id, cadastro, producao) VALUES (1, 0, 0)")
+    conn.execute("""
+        CREATE TABLE producao_fato_alteracoes (
+            codigo_sigtap TEXT NOT NULL,
+            ano INTEGER NOT NULL,
+            mes INTEGER NOT NULL,
+            versao INTEGER NOT NULL,
+            PRIMARY KEY (codigo_sigtap, ano, mes)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_producao_fato_alteracoes_versao ON producao_fato_alteracoes (versao)")
+    for tabela in ('procedimentos', 'producao_classificacao', 'especialidades', 'tipo_cma'):
+        vigiar_tabela_cadastro(conn, tabela)
+
+    def marcar(p):
+        return f"""
+            UPDATE catalogo_sequencia SET producao = producao + 1 WHERE id = 1;
+            INSERT INTO producao_fato_alteracoes (codigo_sigtap, ano, mes, versao)
+            VALUES ({p}codigo_sigtap, {p}ano, {p}mes, (SELECT producao FROM catalogo_sequencia WHERE id = 1))
+            ON CONFLICT (codigo_sigtap, ano, mes) DO UPDATE SET versao = excluded.versao;"""
+    conn.execute(f"CREATE TRIGGER trg_producao_fato_catalogo_insert AFTER INSERT ON producao_fato BEGIN {marcar('NEW.')} END")
+    conn.execute(f"CREATE TRIGGER trg_producao_fato_catalogo_delete AFTER DELETE ON producao_fato BEGIN {marcar('OLD.')} END")
+    conn.execute(f"CREATE TRIGGER trg_producao_fato_catalogo_update AFTER UPDATE ON producao_fato BEGIN {marcar('OLD.')} {marcar('NEW.')} END")
+
+
+def _sql_faixa_etaria(dn):
+    """Faixa etária (rótulos de /api/medicos/stats) a partir da data de nascimento 'AAAA-MM-DD'."""
+    idade = (f"(CAST(strftime('%Y', 'now', 'localtime') AS INTEGER) - CAST(strftime('%Y', {dn}) AS INTEGER)"
+             f" - (strftime('%m-%d', 'now', 'localtime') < strftime('%m-%d', {dn})))")
+    return (f"CASE WHEN {dn} IS NULL OR date({dn}) IS NOT {dn} THEN 'N/D'"
+            f" WHEN {idade} < 30 THEN '< 30 anos' WHEN {idade} < 40 THEN '30-39 anos'"
+            f" WHEN {idade} < 50 THEN '40-49 anos' WHEN {idade} < 60 THEN '50-59 anos'"
+            f" ELSE '60+ anos' END")
+
+
+def _sql_dimensoes_medico(p=''):
+    """[(dimensão, expressão da chave)] de um médico no resumo; p é o prefixo da linha ('NEW.', 'OLD.' ou '')."""
+    local = lambda col: f"CASE WHEN upper(trim({p}{col})) IN ('', 'NONE') THEN NULL ELSE upper(trim({p}{col})) END"
+    return [
+        ('total', "''"),
+        ('sexo', f"CASE trim({p}sexo) WHEN '1' THEN 'Feminino' WHEN '0' THEN 'Masculino' ELSE 'Outros' END"),
+        ('faixa', _sql_faixa_etaria(p + 'dn')),
+        ('origem', local('naturalidade')),
+        ('residencia', local('cidade_res')),
+    ]
+
+
+def _sql_documentos_medico(p=''):
+    """CRM e CPF como digitados e só com dígitos (o tokenizer quebra '389.198.338-77' em quatro termos)."""
+    digitos = lambda col: f"replace(replace(replace(replace(coalesce({p}{col}, ''), '.', ''), '-', ''), '/', ''), ' ', '')"
+    return f"coalesce({p}crm, '') || ' ' || {digitos('crm')} || ' ' || coalesce({p}cpf, '') || ' ' || {digitos('cpf')}"
+
+
+def _medicos_resumo(conn):
+    """
+    Contagens de /api/medicos/stats mantidas por triggers (sexo, faixa etária, naturalidade,
+    cidade de residência e total). A faixa etária depende da data: é recalculada por inteiro
+    (um GROUP BY) quando muda o dia registrado em medicos_resumo_meta.
+    """
+    conn.execute("""
+        CREATE TABLE medicos_resumo (
+            dimensao TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (dimensao, chave)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE TABLE medicos_resumo_meta (chave TEXT PRIMARY KEY, valor TEXT)")
+    conn.execute(f"""
+        CREATE VIEW v_medicos_faixa_etaria AS
+        SELECT {_sql_faixa_etaria('dn')} AS faixa, count(*) AS total FROM medicos GROUP BY 1
+    """)
+
+    def contar(p, sinal):
+        valores = ", ".join(f"('{d}', {chave})" for d, chave in _sql_dimensoes_medico(p))
+        return f"""
+            INSERT INTO medicos_resumo (dimensao, chave, total)
+            SELECT column1, column2, {sinal} FROM (VALUES {valores}) WHERE column2 IS NOT NULL
+            ON CONFLICT (dimensao, chave) DO UPDATE SET total = total + excluded.total;"""
+    remover_zerados = "DELETE FROM medicos_resumo WHERE total <= 0;"
+    colunas = ('dn', 'sexo', 'naturalidade', 'cidade_res')
+    mudou = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in colunas)
+
+    conn.execute(f"CREATE TRIGGER trg_medicos_resumo_insert AFTER INSERT ON medicos BEGIN {contar('NEW.', 1)} END")
+    conn.execute(f"CREATE TRIGGER trg_medicos_resumo_delete AFTER DELETE ON medicos BEGIN {contar('OLD.', -1)} {remover_zerados} END")
+    conn.execute(f"""CREATE TRIGGER trg_medicos_resumo_update AFTER UPDATE OF {', '.join(colunas)} ON medicos
+                     WHEN {mudou} BEGIN {contar('OLD.', -1)} {contar('NEW.', 1)} {remover_zerados} END""")
+
+    conn.execute("INSERT INTO medicos_resumo (dimensao, chave, total) " + "\nUNION ALL ".join(
+        f"SELECT '{d}', {chave}, count(*) FROM medicos GROUP BY 2 HAVING {chave} IS NOT NULL"
+        for d, chave in _sql_dimensoes_medico()))
+    conn.execute("INSERT INTO medicos_resumo_meta (chave, valor) VALUES ('faixa_data', date('now', 'localtime'))")
+
+
+def _amb_chave_unica(conn):
+    """
+    Chave única (especialidade, mês, ano) em producao_amb e producao_exame. Reenvios do mesmo
+    relatório duplicavam as linhas: de cada chave fica a última importação (maior id, sem somar),
+    e as linhas descartadas são copiadas para {tabela}_duplicados antes de sair da tabela.
+    """
+    for tabela in ('producao_amb', 'producao_exame'):
+        duplicadas = f"id NOT IN (SELECT max(id) FROM {tabela} GROUP BY especialidade, mes, ano)"
+        conn.execute(f"CREATE TABLE {tabela}_duplicados AS SELECT *, datetime('now', 'localtime') AS descartado_em FROM {tabela} WHERE {duplicadas}")
+        descartadas = conn.execute(f"DELETE FROM {tabela} WHERE {duplicadas}").rowcount
+        if descartadas:
+            print(f"[amb] {tabela}: {descartadas} linha(s) repetidas por (especialidade, mês, ano) descartadas, "
+                  f"mantida a última importação de cada chave; cópia em {tabela}_duplicados")
+        conn.execute(f"DROP INDEX IF EXISTS idx_{tabela}_esp_periodo")
+        conn.execute(f"CREATE UNIQUE INDEX ux_{tabela}_chave ON {tabela} (especialidade, mes, ano)")
+    conn.execute("ANALYZE")
+
+
+def _amb_dimensoes(conn):
+    """
+    Valores distintos de especialidade, mês e ano de producao_amb e producao_exame (filtros da
+    tela de tabelas), com a contagem de linhas de cada um mantida por triggers na ingestão.
+    """
+    conn.execute("""
+        CREATE TABLE amb_dimensoes (
+            tabela TEXT NOT NULL,
+            dimensao TEXT NOT NULL,
+            chave NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (tabela, dimensao, chave)
+        ) WITHOUT ROWID
+    """)
+    dimensoes = ('especialidade', 'mes', 'ano')
+    for tabela in ('producao_amb', 'producao_exame'):
+        def contar(p, sinal):
+            # UNION ALL com aliases: num VALUES cuja primeira linha referencia NEW/OLD o SQLite não expõe column1/column2
+            valores = " UNION ALL ".join(f"SELECT '{d}' AS dimensao, {p}{d} AS chave" for d in dimensoes)
+            return f"""
+                INSERT INTO amb_dimensoes (tabela, dimensao, chave, total)
+                SELECT '{tabela}', dimensao, chave, {sinal} FROM ({valores}) WHERE chave IS NOT NULL
+                ON CONFLICT (tabela, dimensao, chave) DO UPDATE SET total = total + excluded.total;"""
+        remover_zerados = f"DELETE FROM amb_dimensoes WHERE tabela = '{tabela}' AND total <= 0;"
+        mudou = " OR ".join(f"OLD.{d} IS NOT NEW.{d}" for d in dimensoes)
+
+        conn.execute(f"CREATE TRIGGER trg_{tabela}_dimensoes_insert AFTER INSERT ON {tabela} BEGIN {contar('NEW.', 1)} END")
+        conn.execute(f"CREATE TRIGGER trg_{tabela}_dimensoes_delete AFTER DELETE ON {tabela} BEGIN {contar('OLD.', -1)} {remover_zerados} END")
+        conn.execute(f"""CREATE TRIGGER trg_{tabela}_dimensoes_update AFTER UPDATE OF {', '.join(dimensoes)} ON {tabela}
+                         WHEN {mudou} BEGIN {contar('OLD.', -1)} {contar('NEW.', 1)} {remover_zerados} END""")
+
+        conn.execute("INSERT INTO amb_dimensoes (tabela, dimensao, chave, total) " + "\nUNION ALL ".join(
+            f"SELECT '{tabela}', '{d}', {d}, count(*) FROM {tabela} WHERE {d} IS NOT NULL GROUP BY {d}"
+            for d in dimensoes))
+
+
+MIGRACOES = {
+    'producao': [
+        (1, 'Esquema base', """
+            CREATE TABLE IF NOT EXISTS procedimentos (
+                nome TEXT,
+                codigo_sigtap TEXT,
+                valor_sigtap REAL
+            );
+            CREATE TABLE IF NOT EXISTS producao (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                codigo_sigtap TEXT,
+                tipo TEXT,
+                especialidade TEXT,
+                jan REAL DEFAULT 0, fev REAL DEFAULT 0, mar REAL DEFAULT 0, abr REAL DEFAULT 0,
+                mai REAL DEFAULT 0, jun REAL DEFAULT 0, jul REAL DEFAULT 0, ago REAL DEFAULT 0,
+                "set" REAL DEFAULT 0, "out" REAL DEFAULT 0, nov REAL DEFAULT 0, dez REAL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS especialidades (especialidade TEXT);
+            CREATE TABLE IF NOT EXISTS tipo_cma (tipo TEXT, cirurgia TEXT);
+        """),
+        (2, 'Índices de consulta por código e nome', """
+            CREATE INDEX IF NOT EXISTS idx_producao_codigo ON producao (codigo_sigtap);
+            CREATE INDEX IF NOT EXISTS idx_procedimentos_codigo ON procedimentos (codigo_sigtap);
+            CREATE INDEX IF NOT EXISTS idx_procedimentos_nome ON procedimentos (nome);
+            ANALYZE;
+        """),
+        (3, 'Produção em formato longo (código, ano, mês) com views de compatibilidade', _producao_formato_longo),
+        (4, 'Busca FTS5 de procedimentos (nome sem acentos e código só com dígitos)', _procedimentos_busca),
+        (5, 'Contadores de alteração do cadastro e da produção para o catálogo em memória', _catalogo_sequencia),
+    ],
+    'medicos': [
+        (1, 'Esquema base', """
+            CREATE TABLE IF NOT EXISTS medicos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome TEXT, crm TEXT, dn TEXT, especialidade TEXT, nacionalidade TEXT, naturalidade TEXT,
+                estado_natural TEXT, tel_ddd TEXT, tel_cel TEXT, email TEXT, cpf TEXT, rg TEXT,
+                cep_res TEXT, end_res TEXT, num_res TEXT, comp_res TEXT, bairro_res TEXT,
+                cidade_res TEXT, estado_res TEXT, ativo TEXT, inicio_ativ TEXT, fim_ativ TEXT, sexo TEXT
+            );
+            CREATE TABLE IF NOT EXISTS especialidades_amec (id INTEGER PRIMARY KEY AUTOINCREMENT, especialidade TEXT);
+        """),
+        (2, 'Índice por nome do médico', """
+            CREATE INDEX IF NOT EXISTS idx_medicos_nome ON medicos (nome);
+            ANALYZE;
+        """),
+        # Versão de linha global (rowversion): cada INSERT/UPDATE recebe o próximo número da sequência,
+        # o que permite à API devolver só o que mudou desde a última sincronização (?since=)
+        (3, 'Versão de linha em medicos para sincronização incremental', """
+            CREATE TABLE medicos_sequencia (id INTEGER PRIMARY KEY CHECK (id = 1), versao INTEGER NOT NULL);
+            CREATE TABLE medicos_removidos (id INTEGER PRIMARY KEY, versao INTEGER NOT NULL);
+            ALTER TABLE medicos ADD COLUMN versao INTEGER NOT NULL DEFAULT 0;
+            UPDATE medicos SET versao = id;
+            INSERT INTO medicos_sequencia (id, versao) VALUES (1, (SELECT coalesce(max(id), 0) FROM medicos));
+            CREATE INDEX idx_medicos_versao ON medicos (versao);
+            CREATE INDEX idx_medicos_removidos_versao ON medicos_removidos (versao);
+
+            CREATE TRIGGER trg_medicos_versao_insert AFTER INSERT ON medicos BEGIN
+                UPDATE medicos_sequencia SET versao = versao + 1 WHERE id = 1;
+                UPDATE medicos SET versao = (SELECT versao FROM medicos_sequencia WHERE id = 1) WHERE id = NEW.id;
+            END;
+            CREATE TRIGGER trg_medicos_versao_update AFTER UPDATE ON medicos WHEN NEW.versao = OLD.versao BEGIN
+                UPDATE medicos_sequencia SET versao = versao + 1 WHERE id = 1;
+                UPDATE medicos SET versao = (SELECT versao FROM medicos_sequencia WHERE id = 1) WHERE id = NEW.id;
+            END;
+            CREATE TRIGGER trg_medicos_versao_delete AFTER DELETE ON medicos BEGIN
+                UPDATE medicos_sequencia SET versao = versao + 1 WHERE id = 1;
+                INSERT OR REPLACE INTO medicos_removidos (id, versao)
+                VALUES (OLD.id, (SELECT versao FROM medicos_sequencia WHERE id = 1));
+            END;
+        """),
+        (4, 'Resumo estatístico de médicos mantido por triggers', _medicos_resumo),
+        # Busca textual: acentos removidos pelo tokenizer (remove_diacritics 2), CRM e CPF também só com dígitos
+        (5, 'Índice FTS5 de busca de médicos', f"""
+            CREATE VIRTUAL TABLE medicos_busca USING fts5(
+                nome, documentos, especialidade,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+            INSERT INTO medicos_busca (rowid, nome, documentos, especialidade)
+            SELECT id, nome, {_sql_documentos_medico('')}, especialidade FROM medicos;
+
+            CREATE TRIGGER trg_medicos_busca_insert AFTER INSERT ON medicos BEGIN
+                INSERT INTO medicos_busca (rowid, nome, documentos, especialidade)
+                VALUES (NEW.id, NEW.nome, {_sql_documentos_medico('NEW.')}, NEW.especialidade);
+            END;
+            CREATE TRIGGER trg_medicos_busca_update AFTER UPDATE OF nome, crm, cpf, especialidade ON medicos BEGIN
+                DELETE FROM medicos_busca WHERE rowid = OLD.id;
+                INSERT INTO medicos_busca (rowid, nome, documentos, especialidade)
+                VALUES (NEW.id, NEW.nome, {_sql_documentos_medico('NEW.')}, NEW.especialidade);
+            END;
+            CREATE TRIGGER trg_medicos_busca_delete AFTER DELETE ON medicos BEGIN
+                DELETE FROM medicos_busca WHERE rowid = OLD.id;
+            END;
+        """),
+    ],
+    'amb': [
+        (1, 'Esquema base', """
+            CREATE TABLE IF NOT EXISTS producao_amb (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                especialidade TEXT, oferta INTEGER, agendado INTEGER, realizado INTEGER,
+                mes TEXT, ano INTEGER, usuario TEXT, timestamp TEXT
+            );
+            CREATE TABLE IF NOT EXISTS producao_exame (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                especialidade TEXT, oferta INTEGER, agendado INTEGER, realizado INTEGER,
+                mes TEXT, ano INTEGER, usuario TEXT, timestamp TEXT
+            );
+        """),
+        (2, 'Índices por especialidade e período', """
+            CREATE INDEX IF NOT EXISTS idx_producao_amb_esp_periodo ON producao_amb (especialidade, mes, ano);
+            CREATE INDEX IF NOT EXISTS idx_producao_amb_periodo ON producao_amb (ano, mes);
+            CREATE INDEX IF NOT EXISTS idx_producao_exame_esp_periodo ON producao_exame (especialidade, mes, ano);
+            CREATE INDEX IF NOT EXISTS idx_producao_exame_periodo ON producao_exame (ano, mes);
+            ANALYZE;
+        """),
+        (3, 'Chave única (especialidade, mês, ano) para reimportação idempotente', _amb_chave_unica),
+        (4, 'Dimensões de especialidade e período mantidas por triggers', _amb_dimensoes),
+    ],
+    'cadastro': [
+        (1, 'Esquema base', """
+            CREATE TABLE IF NOT EXISTS usuarios (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                nome_completo TEXT NOT NULL,
+                sexo TEXT,
+                drt TEXT NOT NULL,
+                celular TEXT,
+                ramal TEXT,
+                email TEXT UNIQUE NOT NULL,
+                nivel_acesso TEXT NOT NULL,
+                senha_hash TEXT NOT NULL,
+                primeiro_acesso INTEGER DEFAULT 1
+            );
+            CREATE TABLE IF NOT EXISTS empresas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                empresa_id TEXT UNIQUE, -- UUID
+                razao_social TEXT,
+                cnpj TEXT,
+                objeto_contrato TEXT,
+                data_contratacao TEXT,
+                ativo INTEGER DEFAULT 1,
+                data_inativacao TEXT,
+                arquivo_contrato TEXT,
+                escopo_json TEXT,
+                usuario_cadastro TEXT,
+                data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE IF NOT EXISTS contratos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                empresa_id TEXT, -- Chave estrangeira (UUID)
+                servico TEXT,
+                quantidade INTEGER,
+                valor_unitario REAL,
+                data_contratacao TEXT,
+                vigencia_meses INTEGER,
+                ativo INTEGER DEFAULT 1,
+                usuario_cadastro TEXT,
+                data_cadastro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (empresa_id) REFERENCES empresas (empresa_id)
+            );
+        """),
+        (2, 'Índices de contratos', """
+            CREATE INDEX IF NOT EXISTS idx_contratos_empresa_ativo ON contratos (empresa_id, ativo);
+            CREATE INDEX IF NOT EXISTS idx_contratos_ativo_servico ON contratos (ativo, servico);
+            ANALYZE;
+        """),
+    ],
+}
+
+
+def versao_atual(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            aplicado_em TEXT
+        )
+    """)
+    return conn.execute("SELECT coalesce(max(versao), 0) FROM schema_version").fetchone()[0]
+
+
+def _aplicar(conn, versao, descricao, passo):
+    registro = "INSERT INTO schema_version (versao, descricao, aplicado_em) VALUES (?, ?, datetime('now', 'localtime'))"
+    if callable(passo):
+        conn.execute("BEGIN")
+        passo(conn)
+        conn.execute(registro, (versao, descricao))
+        conn.execute("COMMIT")
+    else:
+        # executescript faz COMMIT implícito antes de começar; o BEGIN/COMMIT explícito mantém a migração atômica
+        desc_sql = descricao.replace("'", "''")
+        conn.executescript(
+            f"BEGIN;\n{passo}\n"
+            f"INSERT INTO schema_version (versao, descricao, aplicado_em) "
+            f"VALUES ({int(versao)}, '{desc_sql}', datetime('now', 'localtime'));\nCOMMIT;")
+
+
+def migrar(nome, db_path=None, verbose=True):
+    """Aplica as migrações pendentes do banco `nome`. Retorna a versão final."""
+    conn = get_db_connection(db_path or BANCOS[nome])
+    conn.isolation_level = None  # controle manual das transações
+    try:
+        atual = versao_atual(conn)
+        for versao, descricao, passo in MIGRACOES[nome]:
+            if versao <= atual: continue
+            try:
+                _aplicar(conn, versao, descricao, passo)
+            except Exception:
+                if conn.in_transaction: conn.execute("ROLLBACK")
+                raise
+            atual = versao
+            if verbose: print(f"[{nome}] migração {versao:03d} aplicada: {descricao}")
+        return atual
+    finally:
+        conn.close()
+
+
+def migrar_todos(verbose=True):
+    """
+    Migra cada banco de forma independente: a falha de um (ex.: ANO_PRODUCAO_LEGADA ausente) não
+    impede os demais. Retorna ({banco: versão final}, {banco: erro}).
+    """
+    versoes, erros = {}, {}
+    for nome in BANCOS:
+        try:
+            versoes[nome] = migrar(nome, verbose=verbose)
+        except Exception as e:
+            erros[nome] = e
+    return versoes, erros
+
+
+def versao_aplicada(db_path):
+    """Versão registrada em schema_version, lida sem alterar o banco (0 se nunca migrado ou inexistente)."""
+    try:
+        conn = sqlite3.connect(f"{Path(db_path).as_uri()}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return 0
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'").fetchone(): return 0
+        return conn.execute("SELECT coalesce(max(versao), 0) FROM schema_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def esquemas_divergentes():
+    """{banco: (versão aplicada, versão esperada)} dos bancos cujo esquema não é o deste código."""
+    versoes = {nome: (versao_aplicada(db_path), MIGRACOES[nome][-1][0]) for nome, db_path in BANCOS.items()}
+    return {nome: v for nome, v in versoes.items() if v[0] != v[1]}
+
+
+def descrever_divergencias(divergentes):
+    bancos = ", ".join(f"{nome} v{aplicada:03d} (esperada v{esperada:03d})" for nome, (aplicada, esperada) in divergentes.items())
+    return f"Esquema dos bancos diferente do esperado pelo código: {bancos}. Rode `python migrations.py`."
+
+
+def status():
+    for nome, db_path in BANCOS.items():
+        conn = get_db_connection(db_path)
+        try:
+            atual = versao_atual(conn)
+        finally:
+            conn.close()
+        ultima = MIGRACOES[nome][-1][0]
+        situacao = "atualizado" if atual >= ultima else f"{ultima - atual} pendente(s)"
+        print(f"{nome:10s} versão {atual:03d} / {ultima:03d} ({situacao})")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'status':
+        status()
+    else:
+        print("--- Atualizando esquemas dos bancos de dados ---")
+        _, erros = migrar_todos()
+        status()
+        for nome, erro in erros.items():
+            print(f"ERRO ao migrar o banco {nome}: {erro}", file=sys.stderr)
+        if erros: sys.exit(1)
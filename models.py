@@ -1,4 +1,9 @@
 from flask_login import UserMixin
+from cache import CacheLRU
+
+# Usuários carregados pelo user_loader (evita uma consulta ao cadastro.db por request autenticado).
+# O TTL limita o tempo em que outro processo pode enxergar um cadastro desatualizado.
+usuarios_cache = CacheLRU(maximo=512, ttl=300)
 
 class User(UserMixin):
     def __init__(self, id, nome, email, nivel_acesso, primeiro_acesso):
@@ -6,4 +11,18 @@ class User(UserMixin):
         self.nome = nome
         self.email = email
         self.nivel_acesso = nivel_acesso
-        self.primeiro_acesso = primeiro_acesso
\ No newline at end of file
+        self.primeiro_acesso = primeiro_acesso
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row['id'], row['nome_completo'], row['email'], row['nivel_acesso'], row['primeiro_acesso'])
+
+
+def guardar_usuario(user):
+    return usuarios_cache.guardar(str(user.id), user)
+
+
+def invalidar_usuario(user_id=None):
+    """Remove um usuário do cache (ou todos, se user_id for None) após alterar o cadastro."""
+    if user_id is None: usuarios_cache.limpar()
+    else: usuarios_cache.invalidar(str(user_id))
@@ -1,8 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, current_app
 from flask_login import login_required, current_user
-from database import get_amb_conn
+from database import get_amb_conn, get_amb_leitura_conn, versao_dados, DB_AMB
 from werkzeug.utils import secure_filename
+from cache import CacheLRU
+from formatos import ler_tabela, FormatoNaoSuportado
 import pandas as pd
+import base64
+import hashlib
 import os
 import json
 from datetime import datetime
@@ -56,46 +60,183 @@ def siresp_sync():
     return current_app.response_class(generate(), mimetype='application/json')
 
 
+TIPOS_TABELA = {'consulta': 'producao_amb', 'exame': 'producao_exame'}
+DIMENSOES_DADOS = ['especialidade', 'mes', 'ano']
+# Colunas de grupo sem NULL: numa chave de keyset um NULL torna a comparação (a, b) > (?, ?) nula
+# e a paginação pararia sem aviso
+CHAVES_GRUPO = {'especialidade': "coalesce(especialidade, '')", 'mes': "coalesce(mes, '')", 'ano': "coalesce(ano, 0)"}
+LIMITE_DADOS_MAXIMO = 5000
+
+
+def sql_taxas(realizado, agendado, oferta):
+    """Taxas de absenteísmo e perda primária (%) calculadas no SQLite."""
+    return (f"CASE WHEN {agendado} > 0 THEN round((1 - {realizado} * 1.0 / {agendado}) * 100, 2) ELSE 0.0 END AS taxa_absenteismo, "
+            f"CASE WHEN {oferta} > 0 THEN round((1 - {agendado} * 1.0 / {oferta}) * 100, 2) ELSE 0.0 END AS taxa_perda_primaria")
+
+
+def codificar_cursor(chave):
+    return base64.urlsafe_b64encode(json.dumps(chave).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    chave = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(chave, list) or not all(isinstance(v, (str, int, float)) for v in chave):
+        raise ValueError('Cursor inválido')
+    return chave
+
+
+# Resposta de /api/ambulatorial/filtros por (versão do banco, tabela) -> (etag, filtros)
+filtros_cache = CacheLRU(maximo=8)
+NOMES_FILTROS = {'especialidade': 'especialidades', 'mes': 'meses', 'ano': 'anos'}
+
+
 @ambulatorial_bp.route('/api/ambulatorial/filtros', methods=['GET'])
 @login_required
 def get_filtros():
-    conn = get_amb_conn()
-    try:
-        filtros = {"especialidades": [], "meses": [], "anos": []}
-        for c in ["especialidade", "mes", "ano"]:
-            res = conn.execute(f"SELECT DISTINCT {c} FROM producao_amb ORDER BY {c}").fetchall()
-            filtros[f"{c}s" if c != "mes" else "meses"] = [r[0] for r in res if r[0]]
-        return jsonify(filtros)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+    """Opções dos filtros lidas da tabela amb_dimensoes (mantida por triggers), com ETag."""
+    tabela = TIPOS_TABELA.get(request.args.get('tipo') or 'consulta')
+    if not tabela: return jsonify({'error': 'Tipo inválido (use consulta ou exame).'}), 400
+    chave = (versao_dados(DB_AMB), tabela)
+    cacheado = filtros_cache.obter(chave)
+    if cacheado is None:
+        conn = get_amb_conn()
+        try:
+            filtros = {"especialidades": [], "meses": [], "anos": []}
+            for dimensao, valor in conn.execute(
+                    "SELECT dimensao, chave FROM amb_dimensoes WHERE tabela = ? ORDER BY dimensao, chave", (tabela,)):
+                if valor: filtros[NOMES_FILTROS[dimensao]].append(valor)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        finally:
+            conn.close()
+        etag = hashlib.sha1(json.dumps(filtros, sort_keys=True).encode()).hexdigest()
+        cacheado = filtros_cache.guardar(chave, (etag, filtros))
+    etag, filtros = cacheado
+    resposta = jsonify(filtros)
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta.make_conditional(request)
 
 
 @ambulatorial_bp.route('/api/ambulatorial/dados', methods=['GET'])
 @login_required
 def get_dados():
+    """
+    Produção com as taxas calculadas no SQL. ?tipo=consulta|exame escolhe a tabela;
+    ?group_by=especialidade,mes,ano soma oferta/agendado/realizado por grupo (taxas sobre as somas).
+    Com group_by, limit ou cursor a resposta é paginada por keyset: {itens, proximo}.
+    Sem esses parâmetros devolve a lista completa, como antes.
+    """
     esp, mes, ano = request.args.get('especialidade'), request.args.get('mes'), request.args.get('ano')
-    conn = get_amb_conn()
+    tabela = TIPOS_TABELA.get(request.args.get('tipo') or 'consulta')
+    if not tabela: return jsonify({'error': 'Tipo inválido (use consulta ou exame).'}), 400
+    grupos = [g.strip() for g in (request.args.get('group_by') or '').split(',') if g.strip()]
+    invalidos = [g for g in grupos if g not in DIMENSOES_DADOS]
+    if invalidos: return jsonify({'error': f"Agrupamento inválido: {', '.join(invalidos)}"}), 400
+    grupos = [d for d in DIMENSOES_DADOS if d in grupos]
+    paginado = bool(grupos) or 'limit' in request.args or 'cursor' in request.args
+    try:
+        limite = max(1, min(int(request.args.get('limit') or LIMITE_DADOS_MAXIMO), LIMITE_DADOS_MAXIMO))
+        cursor = decodificar_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Parâmetros de paginação inválidos.'}), 400
+
+    where, params = [], []
+    if esp and esp != "Todas": where.append("especialidade = ?"); params.append(esp)
+    if mes and mes != "Todos": where.append("mes = ?"); params.append(mes)
+    if ano and ano != "Todos": where.append("ano = ?"); params.append(ano)
+    # A chave do keyset são as colunas do grupo (ou o id); os valores do grupo são os das linhas
+    chave = grupos or ['id']
+    expressoes = [CHAVES_GRUPO.get(c, c) for c in chave]
+    if cursor is not None:
+        if len(cursor) != len(chave): return jsonify({'error': 'Cursor inválido.'}), 400
+        where.append(f"({', '.join(expressoes)}) > ({', '.join('?' * len(chave))})"); params.extend(cursor)
+    filtro = f"WHERE {' AND '.join(where)}" if where else ""
+    if grupos:
+        query = f"""
+            SELECT {', '.join(f'{e} AS {g}' for e, g in zip(expressoes, grupos))}, count(*) AS registros,
+                   sum(oferta) AS oferta, sum(agendado) AS agendado, sum(realizado) AS realizado,
+                   {sql_taxas('sum(realizado)', 'sum(agendado)', 'sum(oferta)')}
+            FROM {tabela} {filtro}
+            GROUP BY {', '.join(expressoes)} ORDER BY {', '.join(expressoes)}"""
+    else:
+        query = f"""
+            SELECT *, {sql_taxas('coalesce(realizado, 0)', 'coalesce(agendado, 0)', 'coalesce(oferta, 0)')}
+            FROM {tabela} {filtro} ORDER BY id"""
+    if paginado: query += " LIMIT ?"; params.append(limite + 1)
+
+    conn = get_amb_leitura_conn()
     try:
-        query = "SELECT * FROM producao_amb WHERE 1=1"
-        params = []
-        if esp and esp != "Todas": query += " AND especialidade = ?"; params.append(esp)
-        if mes and mes != "Todos": query += " AND mes = ?"; params.append(mes)
-        if ano and ano != "Todos": query += " AND ano = ?"; params.append(ano)
-        rows = conn.execute(query, params).fetchall()
-        resultados = []
-        for row in rows:
-            d = dict(row)
-            oferta, agendado, realizado = d.get('oferta', 0) or 0, d.get('agendado', 0) or 0, d.get('realizado', 0) or 0
-            d['taxa_absenteismo'] = round((1 - (realizado / agendado)) * 100, 2) if agendado > 0 else 0.0
-            d['taxa_perda_primaria'] = round((1 - (agendado / oferta)) * 100, 2) if oferta > 0 else 0.0
-            resultados.append(d)
-        return jsonify(resultados)
+        itens = [dict(r) for r in conn.execute(query, params)]
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
+    if not paginado: return jsonify(itens)
+    proximo = None
+    if len(itens) > limite:
+        itens = itens[:limite]
+        proximo = codificar_cursor([itens[-1][c] for c in chave])
+    return jsonify({'itens': itens, 'proximo': proximo})
+
+
+# Relatórios já interpretados em /analisar, pelo token do upload (nome único do arquivo salvo).
+# /confirmar só grava; se o token expirou do cache (ou foi enviado a outro processo), o arquivo é relido.
+uploads_cache = CacheLRU(maximo=32, ttl=1800)
+
+
+def ler_planilha(filepath):
+    """Lê o arquivo inteiro uma única vez, sem cabeçalho: linhas de metadados seguidas da tabela."""
+    return ler_tabela(filepath, header=None)
+
+
+def limpar_contagens(serie):
+    """
+    Converte a coluna inteira em inteiros: valores já numéricos (Excel/HTML) passam direto;
+    texto segue o formato brasileiro (1.234,0). Vazios e inválidos viram 0.
+    """
+    e_texto = serie.map(type).eq(str)
+    numeros = pd.to_numeric(serie.mask(e_texto), errors='coerce').astype('float64')
+    texto = serie[e_texto].str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    numeros[e_texto] = pd.to_numeric(texto, errors='coerce')
+    return numeros.fillna(0).astype('int64')
+
+
+def interpretar_relatorio(df):
+    """Tipo e período (linha 3 do relatório SIRESP) e as linhas tipadas da tabela de produção."""
+    val_a3 = str(df.iloc[2, 0]).strip()
+    val_f3 = ""
+    if df.shape[1] > 5: val_f3 = str(df.iloc[2, 5]).strip()
+    if not val_f3 or " de " not in val_f3:
+        for c in range(df.shape[1]):
+            v = str(df.iloc[2, c])
+            if " de " in v: val_f3 = v; break
+
+    tabela_destino = ""
+    if 'consulta' in val_a3.lower():
+        tabela_destino = "producao_amb"
+    elif 'exame' in val_a3.lower():
+        tabela_destino = "producao_exame"
+    try:
+        partes = val_f3.lower().split(' de '); mes_arquivo, ano_arquivo = partes[0].capitalize(), int(partes[1])
+    except:
+        mes_arquivo, ano_arquivo = val_f3, 0
+
+    header_idx = -1
+    for idx, row in df.iloc[:15].iterrows():
+        row_str = str(row.values).lower()
+        if 'especialidade' in row_str and 'oferta' in row_str: header_idx = idx; break
+    dados = None
+    if header_idx != -1 and df.shape[1] >= 4:
+        df_trabalho = df.iloc[header_idx + 1:, :4].copy()
+        df_trabalho.columns = ['especialidade', 'oferta', 'agendado', 'realizado']
+        df_trabalho = df_trabalho.dropna(how='all')
+        df_trabalho['especialidade'] = df_trabalho['especialidade'].astype(str).str.strip()
+        df_trabalho = df_trabalho[~df_trabalho['especialidade'].str.lower().isin(['', 'nan', 'none', 'total', 'especialidade'])]
+        for c in ['oferta', 'agendado', 'realizado']: df_trabalho[c] = limpar_contagens(df_trabalho[c])
+        dados = df_trabalho
+    return {'tipo_arquivo': val_a3, 'mes_ano': val_f3 or "Data não encontrada", 'tabela': tabela_destino,
+            'mes': mes_arquivo, 'ano': ano_arquivo, 'header_idx': header_idx, 'dados': dados}
 
 
 @ambulatorial_bp.route('/ambulatorial/manual/analisar', methods=['POST'])
@@ -108,38 +249,17 @@ def analisar():
         unique_filename = f"{int(datetime.now().timestamp())}_{filename}"
         filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename);
         file.save(filepath)
-        ext = filename.rsplit('.', 1)[1].lower()
-        df_meta = None
-        if ext == 'csv':
-            try:
-                df_meta = pd.read_csv(filepath, header=None, nrows=5, sep=';', encoding='latin1')
-            except:
-                df_meta = pd.read_csv(filepath, header=None, nrows=5, sep=',', encoding='latin1')
-        else:
-            try:
-                df_meta = pd.read_excel(filepath, header=None, nrows=5)
-            except:
-                df_meta = pd.read_html(filepath, decimal=',', thousands='.', header=None)[0].iloc[:5]
-        val_a3 = str(df_meta.iloc[2, 0]).strip()
-        val_f3 = "Data não encontrada"
-        if df_meta.shape[1] > 5:
-            val_f3 = str(df_meta.iloc[2, 5]).strip()
-        else:
-            for c in range(df_meta.shape[1]):
-                v = str(df_meta.iloc[2, c])
-                if " de " in v and any(char.isdigit() for char in v): val_f3 = v; break
-
-        target_table = ""
-        if 'consulta' in val_a3.lower():
-            target_table = "producao_amb"
-        elif 'exame' in val_a3.lower():
-            target_table = "producao_exame"
-
-        if target_table == "": os.remove(filepath); return jsonify(
-            {'success': False, 'message': f'Tipo desconhecido: {val_a3}'})
+        try:
+            relatorio = interpretar_relatorio(ler_planilha(filepath))
+        except FormatoNaoSuportado as e:
+            os.remove(filepath); return jsonify({'success': False, 'message': str(e)})
+
+        if relatorio['tabela'] == "": os.remove(filepath); return jsonify(
+            {'success': False, 'message': f"Tipo desconhecido: {relatorio['tipo_arquivo']}"})
+        uploads_cache.guardar(unique_filename, relatorio)
         return jsonify(
-            {'success': True, 'confirmation_required': True, 'filename': unique_filename, 'tipo_arquivo': val_a3,
-             'mes_ano': val_f3})
+            {'success': True, 'confirmation_required': True, 'filename': unique_filename,
+             'tipo_arquivo': relatorio['tipo_arquivo'], 'mes_ano': relatorio['mes_ano']})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
@@ -148,89 +268,33 @@ def analisar():
 @login_required
 def confirmar():
     data = request.get_json();
-    filename = data.get('filename')
+    filename = secure_filename(data.get('filename') or '')
     filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    if not os.path.exists(filepath): return jsonify({'success': False, 'message': 'Arquivo expirou.'})
+    if not filename or not os.path.exists(filepath): return jsonify({'success': False, 'message': 'Arquivo expirou.'})
     try:
-        ext = filename.rsplit('.', 1)[1].lower()
-        df_meta = None
-        if ext == 'csv':
-            try:
-                df_meta = pd.read_csv(filepath, header=None, nrows=5, sep=';', encoding='latin1')
-            except:
-                df_meta = pd.read_csv(filepath, header=None, nrows=5, sep=',', encoding='latin1')
-        else:
-            try:
-                df_meta = pd.read_excel(filepath, header=None, nrows=5)
-            except:
-                df_meta = pd.read_html(filepath, decimal=',', thousands='.', header=None)[0].iloc[:5]
-
-        val_a3 = str(df_meta.iloc[2, 0]).strip()
-        val_f3 = ""
-        if df_meta.shape[1] > 5: val_f3 = str(df_meta.iloc[2, 5]).strip()
-        if not val_f3 or " de " not in val_f3:
-            for c in range(df_meta.shape[1]):
-                v = str(df_meta.iloc[2, c])
-                if " de " in v: val_f3 = v; break
-
-        tabela_destino = "producao_amb" if 'consulta' in val_a3.lower() else "producao_exame"
-        try:
-            partes = val_f3.lower().split(' de '); mes_arquivo, ano_arquivo = partes[0].capitalize(), int(partes[1])
-        except:
-            mes_arquivo, ano_arquivo = val_f3, 0
-
-        df_preview = None
-        if ext == 'csv':
-            try:
-                df_preview = pd.read_csv(filepath, header=None, nrows=15, sep=';', encoding='latin1')
-            except:
-                df_preview = pd.read_csv(filepath, header=None, nrows=15, sep=',', encoding='latin1')
-        else:
-            try:
-                df_preview = pd.read_excel(filepath, header=None, nrows=15)
-            except:
-                df_preview = pd.read_html(filepath, decimal=',', thousands='.', header=None)[0].iloc[:15]
-
-        header_idx = -1
-        for idx, row in df_preview.iterrows():
-            row_str = str(row.values).lower()
-            if 'especialidade' in row_str and 'oferta' in row_str: header_idx = idx; break
-        if header_idx == -1: raise Exception("Cabeçalho não encontrado")
-
-        if ext == 'csv':
-            df_dados = pd.read_csv(filepath, header=header_idx, sep=';', encoding='latin1') if ';' in open(filepath,
-                                                                                                           encoding='latin1').read() else pd.read_csv(
-                filepath, header=header_idx, sep=',', encoding='latin1')
-        else:
-            try:
-                df_dados = pd.read_excel(filepath, header=header_idx)
-            except:
-                df_dados = pd.read_html(filepath, decimal=',', thousands='.', header=header_idx)[0]
-        if df_dados.shape[1] < 4: raise Exception("Menos de 4 colunas encontradas.")
-        df_trabalho = df_dados.iloc[:, :4].copy()
-        df_trabalho.columns = ['especialidade', 'oferta', 'agendado', 'realizado']
-        df_trabalho = df_trabalho.dropna(how='all')
+        relatorio = uploads_cache.retirar(filename)
+        if relatorio is None: relatorio = interpretar_relatorio(ler_planilha(filepath))
+        if relatorio['header_idx'] == -1: raise Exception("Cabeçalho não encontrado")
+        if relatorio['dados'] is None: raise Exception("Menos de 4 colunas encontradas.")
+        tabela_destino = relatorio['tabela'] or "producao_exame"
         conn = get_amb_conn()
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        registros = 0
-        for _, row in df_trabalho.iterrows():
-            esp = str(row['especialidade']).strip()
-            if not esp or esp.lower() in ['nan', 'total', 'especialidade']: continue
-
-            def safe_int(v):
-                try:
-                    return int(float(str(v).replace('.', '').replace(',', '.')))
-                except:
-                    return 0
-
-            oferta, agendado, realizado = safe_int(row['oferta']), safe_int(row['agendado']), safe_int(row['realizado'])
-            conn.execute(
-                f"INSERT INTO {tabela_destino} (especialidade, oferta, agendado, realizado, mes, ano, usuario, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (esp, oferta, agendado, realizado, mes_arquivo, ano_arquivo, current_user.email, timestamp))
-            registros += 1
-        conn.commit();
-        conn.close();
+        linhas = [(esp, oferta, agendado, realizado, relatorio['mes'], relatorio['ano'], current_user.email, timestamp)
+                  for esp, oferta, agendado, realizado in relatorio['dados'].astype(object).itertuples(index=False)]
+        try:
+            # Reenviar o relatório de um mês substitui os valores em vez de duplicar as linhas
+            with conn:
+                conn.executemany(f"""
+                    INSERT INTO {tabela_destino} (especialidade, oferta, agendado, realizado, mes, ano, usuario, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (especialidade, mes, ano) DO UPDATE SET
+                        oferta = excluded.oferta, agendado = excluded.agendado, realizado = excluded.realizado,
+                        usuario = excluded.usuario, timestamp = excluded.timestamp
+                """, linhas)
+        finally:
+            conn.close()
+        registros = len(linhas)
         os.remove(filepath)
         return jsonify({'success': True, 'message': f'Sucesso! {registros} registros.'})
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
\ No newline at end of file
+        return jsonify({'success': False, 'message': str(e)})
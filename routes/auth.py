@@ -1,11 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import check_password_hash, generate_password_hash
+from senhas import verificar_senha, gerar_hash, PoolSenhasSaturado, metricas as metricas_senhas
 from database import get_cadastro_conn
-from models import User  # Importaremos User de um arquivo separado ou definiremos aqui se for simples
+from models import User, guardar_usuario, invalidar_usuario  # Importaremos User de um arquivo separado ou definiremos aqui se for simples
 
 auth_bp = Blueprint('auth', __name__)
 
+MSG_SATURADO = 'Muitos acessos simultâneos no momento. Tente novamente em alguns segundos.'
+
+
+def servidor_ocupado(template):
+    flash(MSG_SATURADO, 'error')
+    return render_template(template), 503, {'Retry-After': '5'}
+
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -22,17 +29,15 @@ def login():
         user_data = cursor.fetchone()
         conn.close()
 
-        if user_data and check_password_hash(user_data['senha_hash'], senha):
-            # Import User aqui para evitar ciclo ou defina em models.py
-            from models import User
-            user_obj = User(
-                id=user_data['id'],
-                nome=user_data['nome_completo'],
-                email=user_data['email'],
-                nivel_acesso=user_data['nivel_acesso'],
-                primeiro_acesso=user_data['primeiro_acesso']
-            )
+        try:
+            senha_ok = bool(user_data) and verificar_senha(user_data['senha_hash'], senha)
+        except PoolSenhasSaturado:
+            return servidor_ocupado('login.html')
+
+        if senha_ok:
+            user_obj = User.from_row(user_data)
             login_user(user_obj)
+            guardar_usuario(user_obj)
 
             if user_data['primeiro_acesso'] == 1:
                 return redirect(url_for('auth.primeiro_acesso'))
@@ -59,13 +64,17 @@ def primeiro_acesso():
         elif len(nova_senha) < 6:
             flash('A senha deve ter no mínimo 6 caracteres.', 'error')
         else:
-            novo_hash = generate_password_hash(nova_senha)
+            try:
+                novo_hash = gerar_hash(nova_senha)
+            except PoolSenhasSaturado:
+                return servidor_ocupado('primeiro_acesso.html')
             conn = get_cadastro_conn()
             conn.execute("UPDATE usuarios SET senha_hash = ?, primeiro_acesso = 0 WHERE id = ?",
                          (novo_hash, current_user.id))
             conn.commit()
             conn.close()
 
+            invalidar_usuario(current_user.id)
             current_user.primeiro_acesso = 0
             flash('Senha alterada com sucesso!', 'success')
             return redirect(url_for('main.index'))
@@ -77,4 +86,11 @@ def primeiro_acesso():
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('auth.login'))
\ No newline at end of file
+    return redirect(url_for('auth.login'))
+
+
+@auth_bp.route('/api/metricas/senhas')
+@login_required
+def metricas_hash():
+    # Tempo de hash por login/troca de senha, para calibrar o custo do KDF no hardware
+    return jsonify(metricas_senhas.resumo())
\ No newline at end of file
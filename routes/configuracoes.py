@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, request, flash
 from flask_login import login_required
 from database import get_cadastro_conn
-from werkzeug.security import generate_password_hash
+from senhas import gerar_hash, PoolSenhasSaturado
+from models import invalidar_usuario
 import sqlite3
 
 configuracoes_bp = Blueprint('configuracoes', __name__)
@@ -18,13 +19,17 @@ def cadastro_usuario():
             ramal = request.form.get('ramal')
             email = request.form.get('email')
             nivel = request.form.get('nivel')
-            senha_inicial = generate_password_hash(drt)
+            senha_inicial = gerar_hash(drt)
             conn = get_cadastro_conn()
             conn.execute("INSERT INTO usuarios (nome_completo, sexo, drt, celular, ramal, email, nivel_acesso, senha_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                          (nome, sexo, drt, celular, ramal, email, nivel, senha_inicial))
             conn.commit()
             conn.close()
+            invalidar_usuario()
             flash('Usuário cadastrado com sucesso!', 'success')
         except sqlite3.IntegrityError: flash('Erro: Este e-mail já está cadastrado.', 'error')
+        except PoolSenhasSaturado:
+            flash('Servidor ocupado. Tente novamente em alguns segundos.', 'error')
+            return render_template('cadastro_usuario.html'), 503, {'Retry-After': '5'}
         except Exception as e: flash(f'Erro ao cadastrar: {str(e)}', 'error')
     return render_template('cadastro_usuario.html')
\ No newline at end of file
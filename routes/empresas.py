@@ -1,9 +1,10 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, send_from_directory, current_app
 from flask_login import login_required, current_user
-from database import get_cadastro_conn
+from database import get_cadastro_conn, get_cadastro_leitura_conn, get_analitico_conn
 from werkzeug.utils import secure_filename
 from datetime import datetime, date
 import pdfplumber
+import sqlite3
 import re
 import os
 import json
@@ -84,7 +85,7 @@ def cadastro_automatico():
 @empresas_bp.route('/empresas/contratos')
 @login_required
 def contratos():
-    conn = get_cadastro_conn()
+    conn = get_cadastro_leitura_conn()
     cursor = conn.cursor()
     try:
         cursor.execute("""
@@ -124,6 +125,19 @@ def contratos():
         contratos_processados.append(c)
     return render_template('empresas_contratos.html', contratos=contratos_processados)
 
+@empresas_bp.route('/api/empresas/contratos/realizado')
+@login_required
+def contratos_realizado():
+    """Contratado x realizado (producao_amb) de cada contrato ativo, por ano/mês; ?ano= filtra o ano."""
+    ano = request.args.get('ano', type=int)
+    conn = get_analitico_conn()
+    rows = conn.execute("""
+        SELECT * FROM v_contratos_realizado
+        WHERE ? IS NULL OR ano = ? OR ano IS NULL
+        ORDER BY servico, contrato_id, ano, mes
+    """, (ano, ano)).fetchall()
+    return jsonify([dict(r) for r in rows])
+
 @empresas_bp.route('/empresas/upload_auto', methods=['POST'])
 @login_required
 def upload_auto():
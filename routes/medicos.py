@@ -1,17 +1,19 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context
 from flask_login import login_required
-from database import get_medicos_conn
-from datetime import datetime, date
+from database import get_medicos_conn, get_analitico_conn
+from importacao_medicos import importar_medicos, ler_linhas
+from busca import consulta_fts
+import base64
+import json
+import shutil
+import tempfile
 
 medicos_bp = Blueprint('medicos', __name__)
 
-def calcular_idade(data_nasc_str):
-    try:
-        if not data_nasc_str: return None
-        nasc = datetime.strptime(data_nasc_str, "%Y-%m-%d").date()
-        hoje = date.today()
-        return hoje.year - nasc.year - ((hoje.month, hoje.day) < (nasc.month, nasc.day))
-    except: return None
+CAMPOS_MEDICO = ['nome', 'crm', 'dn', 'especialidade', 'nacionalidade', 'naturalidade', 'estado_natural', 'tel_ddd', 'tel_cel', 'email', 'cpf', 'rg', 'cep_res', 'end_res', 'num_res', 'comp_res', 'bairro_res', 'cidade_res', 'estado_res', 'ativo', 'inicio_ativ', 'fim_ativ', 'sexo']
+CAMPOS_CONSULTA = set(CAMPOS_MEDICO) | {'id', 'versao'}
+LIMITE_PAGINA = 100
+LIMITE_PAGINA_MAXIMO = 1000
 
 @medicos_bp.route('/medicos')
 @login_required
@@ -29,25 +31,119 @@ def estatisticas():
     return render_template('medicos_stats.html')
 
 # APIs
+def codificar_cursor(nome, id):
+    return base64.urlsafe_b64encode(json.dumps([nome, id]).encode()).decode()
+
+def decodificar_cursor(cursor):
+    nome, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return nome, int(id)
+
+def campos_param(valor):
+    """?fields=nome,crm -> colunas validadas (id e versao sempre incluídos)."""
+    if not valor: return ['*']
+    campos = [c.strip() for c in valor.split(',') if c.strip()]
+    invalidos = [c for c in campos if c not in CAMPOS_CONSULTA]
+    if invalidos: raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+    return ['id', 'versao'] + [c for c in campos if c not in ('id', 'versao')]
+
+def versao_atual(conn):
+    return conn.execute("SELECT versao FROM medicos_sequencia WHERE id = 1").fetchone()[0]
+
 @medicos_bp.route('/api/medicos', methods=['GET'])
 @login_required
 def get_medicos():
+    """
+    Sem parâmetros: lista completa (compatibilidade).
+    ?limit=&cursor=  página por (nome, id); 'proximo' é o cursor da página seguinte
+    ?fields=a,b      projeção de colunas
+    ?since=N         apenas médicos alterados após a versão N, mais os ids removidos
+    """
+    args = request.args
     conn = get_medicos_conn()
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM medicos ORDER BY nome")
-        medicos = [dict(row) for row in cursor.fetchall()]
-        return jsonify(medicos)
+        if not any(k in args for k in ('limit', 'cursor', 'fields', 'since')):
+            medicos = [dict(row) for row in conn.execute("SELECT * FROM medicos ORDER BY nome, id")]
+            return jsonify(medicos)
+
+        try:
+            colunas = ', '.join(campos_param(args.get('fields')))
+            limite = max(1, min(int(args.get('limit', LIMITE_PAGINA)), LIMITE_PAGINA_MAXIMO))
+            since = int(args['since']) if args.get('since') not in (None, '') else None
+            cursor = decodificar_cursor(args['cursor']) if args.get('cursor') else None
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Parâmetros inválidos (fields, limit, since ou cursor).'}), 400
+
+        # Lê a versão e as linhas na mesma transação para não perder alterações concorrentes
+        with conn:
+            conn.execute("BEGIN")
+            versao = versao_atual(conn)
+            if since is not None:
+                rows = conn.execute(f"SELECT {colunas} FROM medicos WHERE versao > ? ORDER BY versao LIMIT ?",
+                                    (since, limite + 1)).fetchall()
+                mais = len(rows) > limite
+                rows = rows[:limite]
+                ate = rows[-1]['versao'] if mais else versao
+                removidos = [r[0] for r in conn.execute(
+                    "SELECT id FROM medicos_removidos WHERE versao > ? AND versao <= ?", (since, ate))]
+                return jsonify({'itens': [dict(r) for r in rows], 'removidos': removidos,
+                                'versao': ate, 'mais': mais})
+
+            if cursor is None:
+                where, params = "", ()
+            elif cursor[0] is None:  # NULLs ordenam primeiro
+                where, params = "WHERE (nome IS NULL AND id > ?) OR nome IS NOT NULL", (cursor[1],)
+            else:
+                where, params = "WHERE (nome, id) > (?, ?)", cursor
+            rows = conn.execute(f"SELECT {colunas}, nome AS _nome FROM medicos {where} ORDER BY nome, id LIMIT ?",
+                                (*params, limite + 1)).fetchall()
+        proximo = codificar_cursor(rows[limite - 1]['_nome'], rows[limite - 1]['id']) if len(rows) > limite else None
+        itens = []
+        for row in rows[:limite]:
+            item = dict(row); del item['_nome']
+            itens.append(item)
+        return jsonify({'itens': itens, 'proximo': proximo, 'versao': versao})
+    except Exception as e: return jsonify({'error': str(e)}), 500
+    finally: conn.close()
+
+@medicos_bp.route('/api/medicos/busca', methods=['GET'])
+@login_required
+def buscar_medicos():
+    consulta = consulta_fts(request.args.get('q', ''))
+    if not consulta: return jsonify([])
+    try: limite = max(1, min(int(request.args.get('limit', 20)), 100))
+    except ValueError: limite = 20
+    conn = get_medicos_conn()
+    try:
+        # bm25 com peso maior para o nome; rowid de medicos_busca = medicos.id
+        # (o LIMIT fica na subconsulta para o FTS dirigir o join, sem varrer medicos)
+        rows = conn.execute("""
+            SELECT m.id, m.nome, m.crm, m.especialidade, m.ativo, m.versao
+            FROM (SELECT rowid, bm25(medicos_busca, 10.0, 5.0, 1.0) AS rank FROM medicos_busca
+                  WHERE medicos_busca MATCH ? ORDER BY rank LIMIT ?) b
+            JOIN medicos m ON m.id = b.rowid
+            ORDER BY b.rank, m.nome
+        """, (consulta, limite)).fetchall()
+        return jsonify([dict(r) for r in rows])
     except Exception as e: return jsonify({'error': str(e)}), 500
     finally: conn.close()
 
+@medicos_bp.route('/api/medicos/<int:id>', methods=['GET'])
+@login_required
+def get_medico(id):
+    conn = get_medicos_conn()
+    try:
+        row = conn.execute("SELECT * FROM medicos WHERE id = ?", (id,)).fetchone()
+        if not row: return jsonify({'error': 'Médico não encontrado.'}), 404
+        return jsonify(dict(row))
+    finally: conn.close()
+
 @medicos_bp.route('/api/medicos', methods=['POST'])
 @login_required
 def add_medico():
     data = request.get_json()
     conn = get_medicos_conn()
     try:
-        cols = ['nome', 'crm', 'dn', 'especialidade', 'nacionalidade', 'naturalidade', 'estado_natural', 'tel_ddd', 'tel_cel', 'email', 'cpf', 'rg', 'cep_res', 'end_res', 'num_res', 'comp_res', 'bairro_res', 'cidade_res', 'estado_res', 'ativo', 'inicio_ativ', 'fim_ativ', 'sexo']
+        cols = CAMPOS_MEDICO
         vals = [data.get(c, '') for c in cols]
         placeholders = ', '.join(['?'] * len(cols))
         conn.execute(f"INSERT INTO medicos ({', '.join(cols)}) VALUES ({placeholders})", vals)
@@ -62,7 +158,7 @@ def update_medico(id):
     data = request.get_json()
     conn = get_medicos_conn()
     try:
-        cols = ['nome', 'crm', 'dn', 'especialidade', 'nacionalidade', 'naturalidade', 'estado_natural', 'tel_ddd', 'tel_cel', 'email', 'cpf', 'rg', 'cep_res', 'end_res', 'num_res', 'comp_res', 'bairro_res', 'cidade_res', 'estado_res', 'ativo', 'inicio_ativ', 'fim_ativ', 'sexo']
+        cols = CAMPOS_MEDICO
         updates = ', '.join([f"{c} = ?" for c in cols])
         vals = [data.get(c, '') for c in cols]; vals.append(id)
         conn.execute(f"UPDATE medicos SET {updates} WHERE id = ?", vals)
@@ -71,6 +167,37 @@ def update_medico(id):
     except Exception as e: return jsonify({'success': False, 'message': str(e)}), 500
     finally: conn.close()
 
+@medicos_bp.route('/api/medicos/importar', methods=['POST'])
+@login_required
+def importar_medicos_api():
+    """
+    Importação em massa (CSV/XLSX, campo 'file'): upsert por CRM/CPF em lotes.
+    Responde em NDJSON, uma linha de progresso por lote gravado; a última traz 'concluido': true.
+    """
+    arquivo = request.files.get('file')
+    if not arquivo or not arquivo.filename: return jsonify({'success': False, 'message': 'Nenhum arquivo enviado.'}), 400
+    try: tamanho_lote = max(1, min(int(request.form.get('lote', 500)), 5000))
+    except ValueError: return jsonify({'success': False, 'message': 'Tamanho de lote inválido.'}), 400
+
+    # O upload é fechado quando a view retorna; a resposta em streaming lê de uma cópia temporária
+    copia = tempfile.TemporaryFile()
+    shutil.copyfileobj(arquivo.stream, copia)
+    copia.seek(0)
+    nome_arquivo = arquivo.filename
+
+    def gerar():
+        conn = get_medicos_conn()
+        try:
+            for progresso in importar_medicos(conn, ler_linhas(copia, nome_arquivo), tamanho_lote):
+                yield json.dumps(progresso, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({'concluido': True, 'erro': str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            conn.close()
+            copia.close()
+
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
 @medicos_bp.route('/api/especialidades_amec', methods=['GET'])
 @login_required
 def get_especialidades_amec():
@@ -83,36 +210,60 @@ def get_especialidades_amec():
     except Exception as e: return jsonify([]), 500
     finally: conn.close()
 
+def atualizar_faixas_etarias(conn):
+    """
+    Recalcula a dimensão 'faixa' do resumo (um GROUP BY) quando a data mudou desde o último cálculo.
+    A data é conferida primeiro sem lock; o lock de escrita só é pedido na virada do dia e a data é
+    conferida de novo sob ele (outro worker pode ter recalculado enquanto este esperava).
+    """
+    sql_em_dia = "SELECT valor = date('now', 'localtime') FROM medicos_resumo_meta WHERE chave = 'faixa_data'"
+    atual = conn.execute(sql_em_dia).fetchone()
+    if atual and atual[0]: return
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        atual = conn.execute(sql_em_dia).fetchone()
+        if atual and atual[0]: return
+        conn.execute("DELETE FROM medicos_resumo WHERE dimensao = 'faixa'")
+        conn.execute("INSERT INTO medicos_resumo (dimensao, chave, total) SELECT 'faixa', faixa, total FROM v_medicos_faixa_etaria")
+        conn.execute("INSERT OR REPLACE INTO medicos_resumo_meta (chave, valor) VALUES ('faixa_data', date('now', 'localtime'))")
+
+def top_contagens(contagens, n=10):
+    # O upper() do SQLite só converte ASCII: junta as chaves que diferem apenas em letras acentuadas
+    agrupado = {}
+    for chave, total in contagens:
+        chave = chave.upper()
+        agrupado[chave] = agrupado.get(chave, 0) + total
+    return dict(sorted(agrupado.items(), key=lambda i: i[1], reverse=True)[:n])
+
+@medicos_bp.route('/api/medicos/especialidades/producao', methods=['GET'])
+@login_required
+def especialidades_producao_api():
+    """Médicos (ativos e total) x produção cirúrgica por especialidade no ?ano= (padrão: o mais recente com produção)."""
+    conn = get_analitico_conn()
+    ano = request.args.get('ano', type=int) or conn.execute("SELECT max(ano) FROM v_especialidade_medicos_producao").fetchone()[0]
+    rows = conn.execute("""
+        SELECT especialidade, medicos, medicos_ativos, quantidade_cirurgica, valor_produzido
+        FROM v_especialidade_medicos_producao WHERE ano = ?
+        ORDER BY quantidade_cirurgica DESC, medicos DESC, especialidade
+    """, (ano,)).fetchall()
+    return jsonify({'ano': ano, 'especialidades': [dict(r) for r in rows]})
+
 @medicos_bp.route('/api/medicos/stats', methods=['GET'])
 @login_required
 def stats_api():
     conn = get_medicos_conn()
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT dn, sexo, naturalidade, estado_natural, cidade_res FROM medicos")
-        rows = cursor.fetchall()
-        total = len(rows)
+        atualizar_faixas_etarias(conn)
+        dims = {}
+        for row in conn.execute("SELECT dimensao, chave, total FROM medicos_resumo"):
+            dims.setdefault(row['dimensao'], []).append((row['chave'], row['total']))
+        total = sum(t for _, t in dims.get('total', []))
         sexo = {'Masculino': 0, 'Feminino': 0, 'Outros': 0}
+        sexo.update(dims.get('sexo', []))
         faixa = {'< 30 anos': 0, '30-39 anos': 0, '40-49 anos': 0, '50-59 anos': 0, '60+ anos': 0, 'N/D': 0}
-        origem, residencia = {}, {}
-        for row in rows:
-            s = str(row['sexo']).strip()
-            if s == '1': sexo['Feminino'] += 1
-            elif s == '0': sexo['Masculino'] += 1
-            else: sexo['Outros'] += 1
-            idade = calcular_idade(row['dn'])
-            if idade is None: faixa['N/D'] += 1
-            elif idade < 30: faixa['< 30 anos'] += 1
-            elif idade < 40: faixa['30-39 anos'] += 1
-            elif idade < 50: faixa['40-49 anos'] += 1
-            elif idade < 60: faixa['50-59 anos'] += 1
-            else: faixa['60+ anos'] += 1
-            nat = str(row['naturalidade']).strip().upper()
-            if nat and nat != 'NONE': origem[nat] = origem.get(nat, 0) + 1
-            res = str(row['cidade_res']).strip().upper()
-            if res and res != 'NONE': residencia[res] = residencia.get(res, 0) + 1
-        top_origem = dict(sorted(origem.items(), key=lambda i: i[1], reverse=True)[:10])
-        top_residencia = dict(sorted(residencia.items(), key=lambda i: i[1], reverse=True)[:10])
-        return jsonify({'total': total, 'sexo': sexo, 'faixa_etaria': faixa, 'origem': top_origem, 'residencia': top_residencia})
+        faixa.update(dims.get('faixa', []))
+        return jsonify({'total': total, 'sexo': sexo, 'faixa_etaria': faixa,
+                        'origem': top_contagens(dims.get('origem', [])),
+                        'residencia': top_contagens(dims.get('residencia', []))})
     except Exception as e: return jsonify({'error': str(e)}), 500
     finally: conn.close()
\ No newline at end of file
@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, current_app, url_for
 from flask_login import login_required
-from database import get_producao_conn
-import os
-import requests
+from database import get_producao_conn, versao_dados, DB_PRODUCAO
+from busca import consulta_fts
+from catalogo import CatalogoProcedimentos
+from cache import CacheLRU
+from datetime import date
+import json
+import ia
 
 producao_bp = Blueprint('producao', __name__)
 
@@ -11,9 +15,18 @@ COLUNAS_MESES = {
     7: 'jul', 8: 'ago', 9: 'set', 10: 'out', 11: 'nov', 12: 'dez'
 }
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Catálogo em memória (app.config['CATALOGO_EM_MEMORIA']); desligado, as consultas vão ao SQLite
+catalogo = CatalogoProcedimentos(DB_PRODUCAO)
+
+def usar_catalogo():
+    return current_app.config.get('CATALOGO_EM_MEMORIA', True)
+
+_mapas_auxiliares = {'versao': None, 'mapas': ({}, {})}
 
 def get_auxiliary_maps():
+    """Mapas código -> nome de especialidades e tipo_cma, recarregados só quando o banco muda."""
+    versao = versao_dados(DB_PRODUCAO)
+    if _mapas_auxiliares['versao'] == versao: return _mapas_auxiliares['mapas']
     conn = get_producao_conn()
     cursor = conn.cursor()
     mapa_esp, mapa_tipo = {}, {}
@@ -26,8 +39,19 @@ def get_auxiliary_maps():
             if len(list(r)) >= 2: mapa_tipo[str(r[0])] = str(r[1])
     except: pass
     conn.close()
+    _mapas_auxiliares.update(versao=versao, mapas=(mapa_esp, mapa_tipo))
     return mapa_esp, mapa_tipo
 
+# Resultados de /api/producao_mensal, /api/historico e /api/procedimento por código e período, só no
+# caminho SQL (CATALOGO_EM_MEMORIA=0): com o catálogo ligado (padrão) as consultas já são leituras
+# em memória, atualizadas pelo catálogo quando o banco muda, e não passam por este cache.
+# gravar_producao invalida os códigos gravados; o TTL cobre gravações feitas por outro processo.
+consultas_cache = CacheLRU(maximo=2048, ttl=600)
+
+def invalidar_consultas(codigos):
+    codigos = set(codigos)
+    return consultas_cache.invalidar_se(lambda chave: chave[1] in codigos)
+
 @producao_bp.route('/producao')
 @login_required
 def index():
@@ -43,79 +67,379 @@ def cirurgica():
 def search_procedimento():
     term = request.args.get('term', '')
     if len(term) < 3: return jsonify([])
+    if usar_catalogo():
+        return jsonify([{'nome': p.nome, 'codigo_sigtap': p.codigo, 'valor_sigtap': p.valor,
+                         'tipo_cirurgia': p.tipo, 'nome_especialidade': p.especialidade} for p in catalogo.buscar(term)])
+    consulta = consulta_fts(term, coluna_codigo='codigo')
+    if not consulta: return jsonify([])
+    mapa_esp, mapa_tipo = get_auxiliary_maps()
     conn = get_producao_conn()
     cursor = conn.cursor()
-    mapa_esp, mapa_tipo = get_auxiliary_maps()
-    try:
-        cursor.execute("SELECT nome, codigo_sigtap, valor_sigtap FROM procedimentos WHERE nome LIKE ? LIMIT 15", ('%' + term + '%',))
-    except:
-        cursor.execute("SELECT nome, codigo_sus as codigo_sigtap, valor_sigtap FROM procedimentos WHERE nome LIKE ? LIMIT 15", ('%' + term + '%',))
-    resultado = []
-    for row in cursor.fetchall():
-        proc = dict(row)
-        cursor.execute("SELECT tipo, especialidade FROM producao WHERE codigo_sigtap = ? LIMIT 1", (proc['codigo_sigtap'],))
-        info = cursor.fetchone()
-        t, e = "Não classificado", "Geral"
-        if info:
-            ct, ce = str(info['tipo'] or ''), str(info['especialidade'] or '')
-            t = mapa_tipo.get(ct, ct) if ct else t
-            e = mapa_esp.get(ce, ce) if ce else e
-        proc.update({'tipo_cirurgia': t, 'nome_especialidade': e})
-        resultado.append(proc)
+    # Índice FTS5 (acentos ignorados, prefixos, código com ou sem pontuação), ordenado por bm25,
+    # já com a primeira classificação de cada código (uma única consulta por tecla)
+    cursor.execute("""
+        SELECT p.nome, p.codigo_sigtap, p.valor_sigtap, c.tipo, c.especialidade
+        FROM (SELECT rowid, rank FROM procedimentos_busca WHERE procedimentos_busca MATCH ? ORDER BY rank LIMIT 15) b
+        JOIN procedimentos p ON p.id = b.rowid
+        LEFT JOIN producao_classificacao c
+               ON c.id = (SELECT min(id) FROM producao_classificacao WHERE codigo_sigtap = p.codigo_sigtap)
+        ORDER BY b.rank
+    """, (consulta,))
+    rows = cursor.fetchall()
     conn.close()
+    resultado = []
+    for row in rows:
+        ct, ce = str(row['tipo'] or ''), str(row['especialidade'] or '')
+        resultado.append({
+            'nome': row['nome'], 'codigo_sigtap': row['codigo_sigtap'], 'valor_sigtap': row['valor_sigtap'],
+            'tipo_cirurgia': mapa_tipo.get(ct, ct) if ct else "Não classificado",
+            'nome_especialidade': mapa_esp.get(ce, ce) if ce else "Geral",
+        })
     return jsonify(resultado)
 
+def ano_param(valor):
+    return int(valor) if valor else date.today().year
+
+def limpar_codigo(cod):
+    """Código SIGTAP como gravado no banco: sem NBSP nem espaços nas pontas."""
+    return str(cod or '').replace('\xa0', '').strip()
+
+LOTE_MAXIMO = 5000
+
+SQL_UPSERT_PRODUCAO = """
+    INSERT INTO producao_fato (codigo_sigtap, ano, mes, especialidade, quantidade) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (codigo_sigtap, ano, mes, especialidade) DO UPDATE SET quantidade = excluded.quantidade
+"""
+
+def especialidades_padrao(conn, codigos):
+    """Primeira classificação cadastrada de cada código (comportamento da antiga tabela horizontal)."""
+    codigos, mapa = list(codigos), {}
+    for i in range(0, len(codigos), 500):
+        parte = codigos[i:i + 500]
+        rows = conn.execute(f"SELECT codigo_sigtap, especialidade FROM producao_classificacao WHERE codigo_sigtap IN ({', '.join('?' * len(parte))}) ORDER BY id", parte).fetchall()
+        for r in rows: mapa.setdefault(r['codigo_sigtap'], r['especialidade'])
+    return mapa
+
+def validar_item_producao(item):
+    cod = limpar_codigo(item.get('codigo_sigtap') or item.get('codigo_sus'))
+    if not cod: raise ValueError('Código SIGTAP ausente')
+    ano, mes, qtd = ano_param(item.get('ano')), int(item['mes']), float(item['quantidade'])
+    if mes not in COLUNAS_MESES: raise ValueError(f'Mês inválido: {mes}')
+    if qtd < 0: raise ValueError('Quantidade negativa')
+    return cod, ano, mes, (item.get('especialidade') or None), qtd
+
+def gravar_producao(conn, itens):
+    """
+    Valida e grava os lançamentos em uma única transação (upsert pela chave código/ano/mês/especialidade).
+    Retorna o resultado por item; itens inválidos não impedem a gravação dos demais.
+    """
+    resultados, validos = [], []
+    for i, item in enumerate(itens):
+        try:
+            validos.append((i, validar_item_producao(item)))
+            resultados.append({'indice': i, 'success': True, 'message': 'Salvo'})
+        except (KeyError, TypeError, ValueError) as e:
+            msg = f'Campo obrigatório ausente: {e}' if isinstance(e, KeyError) else str(e)
+            resultados.append({'indice': i, 'success': False, 'message': msg})
+    if not validos: return resultados
+
+    padrao = especialidades_padrao(conn, {v[0] for _, v in validos if v[3] is None})
+    linhas = []
+    for i, (cod, ano, mes, esp, qtd) in validos:
+        esp = esp if esp is not None else padrao.get(cod, '')
+        resultados[i].update({'codigo_sigtap': cod, 'ano': ano, 'mes': mes, 'especialidade': esp})
+        linhas.append((cod, ano, mes, esp, qtd))
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO producao_classificacao (codigo_sigtap, especialidade) VALUES (?, ?)", {(l[0], l[3]) for l in linhas})
+        conn.executemany(SQL_UPSERT_PRODUCAO, linhas)
+    invalidar_consultas(l[0] for l in linhas)
+    return resultados
+
 @producao_bp.route('/api/submit_producao', methods=['POST'])
 @login_required
 def submit_producao():
     data = request.get_json()
     conn = get_producao_conn()
-    cursor = conn.cursor()
     try:
-        cod = data.get('codigo_sigtap') or data.get('codigo_sus')
-        mes, qtd = int(data['mes']), float(data['quantidade'])
-        col = COLUNAS_MESES.get(mes)
-        cursor.execute("SELECT id FROM producao WHERE codigo_sigtap = ?", (cod,))
-        row = cursor.fetchone()
-        col_sql = f'"{col}"' if col in ['set', 'out'] else col
-        if row: cursor.execute(f"UPDATE producao SET {col_sql} = ? WHERE id = ?", (qtd, row['id']))
-        else: cursor.execute(f"INSERT INTO producao (codigo_sigtap, {col_sql}) VALUES (?, ?)", (cod, qtd))
-        conn.commit()
+        res = gravar_producao(conn, [data])[0]
+        if not res['success']: return jsonify({'success': False, 'message': res['message']}), 400
         return jsonify({'success': True, 'message': 'Salvo'})
     except Exception as e: return jsonify({'success': False, 'message': str(e)}), 500
     finally: conn.close()
 
+@producao_bp.route('/api/submit_producao/lote', methods=['POST'])
+@login_required
+def submit_producao_lote():
+    """Lançamento em lote: lista de {codigo_sigtap, ano, mes, quantidade[, especialidade]} gravada em uma transação."""
+    data = request.get_json(silent=True)
+    itens = data.get('itens') if isinstance(data, dict) else data
+    if not isinstance(itens, list) or not itens: return jsonify({'success': False, 'message': 'Envie uma lista de lançamentos em "itens".'}), 400
+    if len(itens) > LOTE_MAXIMO: return jsonify({'success': False, 'message': f'Máximo de {LOTE_MAXIMO} lançamentos por lote.'}), 413
+    conn = get_producao_conn()
+    try:
+        resultados = gravar_producao(conn, [i if isinstance(i, dict) else {} for i in itens])
+        gravados = sum(1 for r in resultados if r['success'])
+        status = 200 if gravados else 400
+        return jsonify({'success': gravados == len(resultados), 'gravados': gravados, 'erros': len(resultados) - gravados, 'resultados': resultados}), status
+    except Exception as e: return jsonify({'success': False, 'message': str(e)}), 500
+    finally: conn.close()
+
 @producao_bp.route('/api/producao_mensal', methods=['GET'])
 @login_required
 def get_producao_mensal():
-    cod, mes = request.args.get('codigo_sigtap'), int(request.args.get('mes', 0))
-    col = COLUNAS_MESES.get(mes)
+    cod = limpar_codigo(request.args.get('codigo_sigtap'))
+    try: ano, mes = ano_param(request.args.get('ano')), int(request.args.get('mes', 0))
+    except ValueError: return jsonify({'encontrado': False, 'error': 'Parâmetros inválidos.'}), 400
+    if usar_catalogo():
+        proc = catalogo.obter(cod)
+        if not proc: return jsonify({'encontrado': False})
+        total = catalogo.total_mes(cod, ano, mes)
+        return jsonify({'encontrado': True, 'ano': ano, 'total': total, 'valor_total_produzido': total * proc.valor})
+    chave = ('mensal', cod, ano, mes)
+    resposta = consultas_cache.obter(chave)
+    if resposta is not None: return jsonify(resposta)
     conn = get_producao_conn()
-    col_sql = f'"{col}"' if col in ['set', 'out'] else col
     try:
-        res = conn.execute(f"SELECT t.{col_sql} as q, p.nome, p.valor_sigtap FROM producao t JOIN procedimentos p ON t.codigo_sigtap = p.codigo_sigtap WHERE t.codigo_sigtap = ?", (cod,)).fetchone()
-        if res: return jsonify({'encontrado': True, 'total': res['q'] or 0, 'valor_total_produzido': (res['q'] or 0) * (res['valor_sigtap'] or 0)})
-        return jsonify({'encontrado': False})
+        res = conn.execute("""
+            SELECT p.nome, p.valor_sigtap,
+                   (SELECT sum(f.quantidade) FROM producao_fato f
+                    WHERE f.codigo_sigtap = p.codigo_sigtap AND f.ano = ? AND f.mes = ?) AS q
+            FROM procedimentos p WHERE p.codigo_sigtap = ?
+        """, (ano, mes, cod)).fetchone()
+        if res: resposta = {'encontrado': True, 'ano': ano, 'total': res['q'] or 0, 'valor_total_produzido': (res['q'] or 0) * (res['valor_sigtap'] or 0)}
+        else: resposta = {'encontrado': False}
+        return jsonify(consultas_cache.guardar(chave, resposta))
     except: return jsonify({'encontrado': False})
     finally: conn.close()
 
+def serie_producao(cod, ano_inicial, ano):
+    """(existe, {(ano, mes): total}) do código no período; existe = tem produção ou classificação."""
+    if usar_catalogo():
+        totais = catalogo.serie(cod, ano_inicial, ano)
+        return bool(totais or catalogo.classificado(cod)), totais
+    chave = ('historico', cod, ano_inicial, ano)
+    cacheado = consultas_cache.obter(chave)
+    if cacheado is None:
+        conn = get_producao_conn()
+        rows = conn.execute("""
+            SELECT ano, mes, sum(quantidade) AS total FROM producao_fato
+            WHERE codigo_sigtap = ? AND ano BETWEEN ? AND ?
+            GROUP BY ano, mes
+        """, (cod, ano_inicial, ano)).fetchall()
+        existe = bool(rows or conn.execute("SELECT 1 FROM producao_classificacao WHERE codigo_sigtap = ? LIMIT 1", (cod,)).fetchone())
+        conn.close()
+        cacheado = consultas_cache.guardar(chave, (existe, {(r['ano'], r['mes']): r['total'] for r in rows}))
+    return cacheado
+
+ANOS_HISTORICO_MAXIMO = 10
+
 @producao_bp.route('/api/historico', methods=['GET'])
 @login_required
 def get_historico():
-    cod = request.args.get('codigo_sigtap')
+    """Série mensal do ano (padrão: corrente). Com ano_inicial, devolve a série de vários anos."""
+    cod = limpar_codigo(request.args.get('codigo_sigtap'))
+    try:
+        ano = ano_param(request.args.get('ano'))
+        ano_inicial = int(request.args.get('ano_inicial') or ano)
+    except ValueError: return jsonify({'error': 'Parâmetros inválidos.'}), 400
+    # A resposta tem 12 linhas por ano: no máximo ANOS_HISTORICO_MAXIMO anos, terminando em `ano`
+    ano_inicial = min(max(ano_inicial, ano - ANOS_HISTORICO_MAXIMO + 1), ano)
+    existe, totais = serie_producao(cod, ano_inicial, ano)
+    if not existe: return jsonify({'data': []})
+    if ano_inicial == ano:
+        hist = [{'mes': m, 'total_producao': totais.get((ano, m), 0)} for m in range(1, 13)]
+    else:
+        hist = [{'ano': a, 'mes': m, 'total_producao': totais.get((a, m), 0)} for a in range(ano_inicial, ano + 1) for m in range(1, 13)]
+    return jsonify({'data': hist, 'ano': ano})
+
+def detalhe_procedimento(cod, ano):
+    """Cadastro, primeira classificação e os 12 meses de produção do ano de um procedimento (None se não existe)."""
+    if usar_catalogo():
+        proc = catalogo.obter(cod)
+        if not proc: return None
+        serie = catalogo.serie(cod, ano, ano)
+        return {'nome': proc.nome, 'codigo_sigtap': proc.codigo, 'valor_sigtap': proc.valor,
+                'tipo_cirurgia': proc.tipo, 'nome_especialidade': proc.especialidade,
+                'meses': [serie.get((ano, m), 0) for m in range(1, 13)]}
+    chave = ('procedimento', cod, ano)
+    detalhe = consultas_cache.obter(chave)
+    if detalhe is not None: return detalhe or None
     conn = get_producao_conn()
-    cols = ", ".join([f't."{v}"' if v in ['set','out'] else f't.{v}' for v in COLUNAS_MESES.values()])
-    res = conn.execute(f"SELECT {cols} FROM producao t WHERE t.codigo_sigtap = ?", (cod,)).fetchone()
-    hist = [{'mes': m, 'total_producao': res[m-1] or 0} for m in range(1, 13)] if res else []
-    conn.close()
-    return jsonify({'data': hist})
+    try:
+        row = conn.execute("""
+            SELECT p.nome, p.codigo_sigtap, p.valor_sigtap, c.tipo, c.especialidade,
+                   (SELECT json_group_array(json_array(mes, total)) FROM
+                       (SELECT mes, sum(quantidade) AS total FROM producao_fato
+                        WHERE codigo_sigtap = p.codigo_sigtap AND ano = ? GROUP BY mes)) AS meses
+            FROM procedimentos p
+            LEFT JOIN producao_classificacao c
+                   ON c.id = (SELECT min(id) FROM producao_classificacao WHERE codigo_sigtap = p.codigo_sigtap)
+            WHERE p.codigo_sigtap = ?
+            ORDER BY p.id LIMIT 1
+        """, (ano, cod)).fetchone()
+    finally: conn.close()
+    if not row:
+        consultas_cache.guardar(chave, {})
+        return None
+    mapa_esp, mapa_tipo = get_auxiliary_maps()
+    ct, ce = str(row['tipo'] or ''), str(row['especialidade'] or '')
+    totais = dict(json.loads(row['meses']))
+    return consultas_cache.guardar(chave, {
+        'nome': row['nome'], 'codigo_sigtap': row['codigo_sigtap'], 'valor_sigtap': row['valor_sigtap'] or 0,
+        'tipo_cirurgia': mapa_tipo.get(ct, ct) if ct else "Não classificado",
+        'nome_especialidade': mapa_esp.get(ce, ce) if ce else "Geral",
+        'meses': [totais.get(m, 0) for m in range(1, 13)]})
+
+@producao_bp.route('/api/procedimento/<codigo_sigtap>', methods=['GET'])
+@login_required
+def get_procedimento(codigo_sigtap):
+    """Tudo o que a tela de consulta mostra de um procedimento: cadastro, classificação, série do ano e total do ?mes=."""
+    try: ano, mes = ano_param(request.args.get('ano')), int(request.args.get('mes') or date.today().month)
+    except ValueError: return jsonify({'encontrado': False, 'error': 'Parâmetros inválidos.'}), 400
+    if mes not in COLUNAS_MESES: return jsonify({'encontrado': False, 'error': f'Mês inválido: {mes}'}), 400
+    detalhe = detalhe_procedimento(limpar_codigo(codigo_sigtap), ano)
+    if not detalhe: return jsonify({'encontrado': False}), 404
+    meses = detalhe['meses']
+    return jsonify({
+        'encontrado': True, 'ano': ano, 'mes': mes,
+        **{k: v for k, v in detalhe.items() if k != 'meses'},
+        'historico': [{'mes': m, 'total_producao': meses[m - 1]} for m in range(1, 13)],
+        'total': meses[mes - 1], 'valor_total_produzido': meses[mes - 1] * detalhe['valor_sigtap'],
+    })
+
+@producao_bp.route('/api/producao/cache', methods=['GET'])
+@login_required
+def estatisticas_cache():
+    return jsonify({'consultas': consultas_cache.estatisticas(), 'agregados': agregados_cache.estatisticas(),
+                    'catalogo': {'ativo': usar_catalogo(), 'recargas': catalogo.recargas}})
+
+# Dimensões aceitas em /api/producao/agregado (?agrupar=) e a expressão SQL de cada uma
+DIMENSOES_AGREGADO = {
+    'especialidade': 'f.especialidade',
+    'tipo': "coalesce(c.tipo, '')",
+    'ano': 'f.ano',
+    'mes': 'f.mes',
+    'codigo': 'f.codigo_sigtap',
+}
+agregados_cache = CacheLRU(maximo=128)
+
+def agregar_producao(conn, dimensoes, ano_inicial, ano, filtros):
+    colunas = [f"{DIMENSOES_AGREGADO[d]} AS {d}" for d in dimensoes]
+    where, params = ["f.ano BETWEEN ? AND ?"], [ano_inicial, ano]
+    for dim, valor in filtros.items():
+        where.append(f"{DIMENSOES_AGREGADO[dim]} = ?"); params.append(valor)
+    grupo = f"GROUP BY {', '.join(str(i) for i in range(1, len(dimensoes) + 1))}" if dimensoes else ""
+    # Valor = quantidade x valor SIGTAP do procedimento (um único GROUP BY sobre o fato)
+    return conn.execute(f"""
+        SELECT {', '.join(colunas + [''])}
+               sum(f.quantidade) AS quantidade,
+               sum(f.quantidade * coalesce(p.valor_sigtap, 0)) AS valor
+        FROM producao_fato f
+        LEFT JOIN producao_classificacao c ON c.codigo_sigtap = f.codigo_sigtap AND c.especialidade = f.especialidade
+        LEFT JOIN procedimentos p ON p.id = (SELECT min(id) FROM procedimentos WHERE codigo_sigtap = f.codigo_sigtap)
+        WHERE {' AND '.join(where)}
+        {grupo}
+        ORDER BY {', '.join(str(i) for i in range(1, len(dimensoes) + 1)) or 'quantidade'}
+    """, params).fetchall()
+
+@producao_bp.route('/api/producao/agregado', methods=['GET'])
+@login_required
+def get_producao_agregada():
+    """
+    Quantidade e valor produzido (quantidade x valor SIGTAP) agrupados por ?agrupar=especialidade,tipo,mes
+    (também ano e codigo), no período ?ano_inicial..?ano, com filtros opcionais ?especialidade= e ?tipo=.
+    """
+    try:
+        dimensoes = [d.strip() for d in request.args.get('agrupar', 'especialidade,tipo,mes').split(',') if d.strip()]
+        ano = ano_param(request.args.get('ano'))
+        ano_inicial = int(request.args.get('ano_inicial') or ano)
+    except ValueError: return jsonify({'error': 'Parâmetros inválidos.'}), 400
+    invalidas = [d for d in dimensoes if d not in DIMENSOES_AGREGADO]
+    if invalidas: return jsonify({'error': f"Dimensões inválidas: {', '.join(invalidas)}"}), 400
+    filtros = {d: request.args[d] for d in ('especialidade', 'tipo') if request.args.get(d)}
+
+    chave = (versao_dados(DB_PRODUCAO), tuple(dimensoes), ano_inicial, ano, tuple(sorted(filtros.items())))
+    resposta = agregados_cache.obter(chave)
+    if resposta is None:
+        mapa_esp, mapa_tipo = get_auxiliary_maps()
+        conn = get_producao_conn()
+        try: rows = agregar_producao(conn, dimensoes, ano_inicial, ano, filtros)
+        finally: conn.close()
+        linhas = []
+        for r in rows:
+            linha = dict(r)
+            if 'tipo' in linha: linha['nome_tipo'] = mapa_tipo.get(str(linha['tipo']), linha['tipo']) if linha['tipo'] else "Não classificado"
+            if 'especialidade' in linha: linha['nome_especialidade'] = mapa_esp.get(str(linha['especialidade']), linha['especialidade']) or "Geral"
+            linhas.append(linha)
+        resposta = agregados_cache.guardar(chave, {
+            'agrupar': dimensoes, 'ano_inicial': ano_inicial, 'ano': ano, 'linhas': linhas,
+            'totais': {'quantidade': sum(l['quantidade'] or 0 for l in linhas), 'valor': sum(l['valor'] or 0 for l in linhas)},
+        })
+    return jsonify(resposta)
+
+ANOS_PERFIL_SAZONAL = 3
+NOMES_MESES = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+def resumo_producao(cod, ano):
+    """
+    Resumo de tamanho fixo da produção de um procedimento para o prompt da IA: totais e valor do ano e
+    do anterior, série mensal, variações mês a mês e perfil sazonal dos últimos ANOS_PERFIL_SAZONAL anos.
+    """
+    detalhe = detalhe_procedimento(cod, ano)
+    if not detalhe: return None
+    _, totais = serie_producao(cod, ano - ANOS_PERFIL_SAZONAL + 1, ano)
+    valor = detalhe['valor_sigtap'] or 0
+    meses = detalhe['meses']
+    total_ano = sum(meses)
+    total_anterior = sum(totais.get((ano - 1, m), 0) for m in range(1, 13))
+    pct = lambda atual, anterior: f"{(atual - anterior) / anterior * 100:+.0f}%" if anterior else "n/d"
+    variacoes = [f"{NOMES_MESES[m]} {pct(meses[m], meses[m - 1])}" for m in range(1, 12) if meses[m] or meses[m - 1]]
+    anos_com_dados = sorted({a for a, _ in totais})
+    media_geral = sum(totais.values()) / (12 * len(anos_com_dados)) if anos_com_dados else 0
+    perfil = [sum(totais.get((a, m), 0) for a in anos_com_dados) / len(anos_com_dados) / media_geral if media_geral else 0
+              for m in range(1, 13)]
+    linhas = [
+        f"Procedimento: {detalhe['nome']} (SIGTAP {detalhe['codigo_sigtap']}); especialidade {detalhe['nome_especialidade']}; "
+        f"{detalhe['tipo_cirurgia']}; valor SIGTAP R$ {valor:.2f}.",
+        f"{ano}: {total_ano:.0f} procedimentos, R$ {total_ano * valor:.2f} produzidos. "
+        f"{ano - 1}: {total_anterior:.0f} procedimentos, R$ {total_anterior * valor:.2f} (variação {pct(total_ano, total_anterior)}).",
+        f"Mensal {ano}: " + ", ".join(f"{NOMES_MESES[m]} {meses[m]:.0f}" for m in range(12)) + ".",
+        "Variação mês a mês: " + (", ".join(variacoes) if variacoes else "sem produção") + ".",
+    ]
+    if media_geral:
+        linhas.append(f"Perfil sazonal {anos_com_dados[0]}-{anos_com_dados[-1]} (média do mês / média mensal): "
+                      + ", ".join(f"{NOMES_MESES[m]} {perfil[m]:.2f}" for m in range(12)) + ".")
+        linhas.append(f"Pico em {NOMES_MESES[perfil.index(max(perfil))]}, menor produção em {NOMES_MESES[perfil.index(min(perfil))]}.")
+    return "\n".join(linhas)
 
 @producao_bp.route('/api/analise_ia', methods=['POST'])
 @login_required
 def analise_ia():
-    if not GEMINI_API_KEY: return jsonify({'error': 'Sem chave API'}), 500
-    data = request.get_json()
-    try:
-        res = requests.post(f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={GEMINI_API_KEY}", json={"contents": [{"parts": [{"text": f"Analise: {data}"}]}]})
-        return jsonify({'markdown': res.json()['candidates'][0]['content']['parts'][0]['text']})
-    except Exception as e: return jsonify({'error': str(e)}), 500
\ No newline at end of file
+    """
+    Agenda a análise de {codigo_sigtap[, ano]} e devolve o job (202); acompanhe em /api/analise_ia/<job_id>.
+    O modelo recebe só o resumo calculado no servidor (resumo_producao), nunca o JSON enviado pelo navegador.
+    """
+    data = request.get_json(silent=True) or {}
+    try: ano = ano_param(data.get('ano'))
+    except (TypeError, ValueError): return jsonify({'error': 'Ano inválido.'}), 400
+    resumo = resumo_producao(limpar_codigo(data.get('codigo_sigtap')), ano)
+    if not resumo: return jsonify({'error': 'Procedimento não encontrado.'}), 404
+    prompt = ("Você é analista de produção cirúrgica de um ambulatório. Com base no resumo abaixo, comente em "
+              "português, em markdown e de forma concisa, a tendência, a sazonalidade e o impacto financeiro, "
+              "com recomendações práticas.\n\n" + resumo)
+    try: job = ia.enviar_analise(prompt)
+    except ia.IAIndisponivel as e: return jsonify({'error': str(e)}), 503, {'Retry-After': '10'}
+    status = 200 if job['estado'] == 'concluido' else 202
+    return jsonify({**job, 'status_url': url_for('producao.analise_ia_job', job_id=job['id'])}), status
+
+@producao_bp.route('/api/analise_ia/<job_id>', methods=['GET'])
+@login_required
+def analise_ia_job(job_id):
+    job = ia.obter_job(job_id)
+    if job is None: return jsonify({'estado': 'erro', 'error': 'Análise não encontrada ou expirada.'}), 404
+    return jsonify(job)
+
+@producao_bp.route('/api/analise_ia/status', methods=['GET'])
+@login_required
+def analise_ia_status():
+    return jsonify(ia.resumo())
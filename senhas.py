@@ -0,0 +1,154 @@
+"""
+Hash e verificação de senhas fora da thread do request.
+
+check_password_hash/generate_password_hash são propositalmente caros (KDF); executados inline,
+uma troca de turno com dezenas de logins simultâneos trava o servidor inteiro. Aqui eles rodam num
+ProcessPoolExecutor limitado, com uma fila máxima: acima dela a chamada falha na hora com
+PoolSenhasSaturado (a rota responde 503 "tente novamente") em vez de acumular requests.
+O pool só é usado depois de init_app(app); antes disso (scripts de setup) o hash roda inline.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', min(4, os.cpu_count() or 1)))
+HASH_FILA_MAXIMA = int(os.getenv('HASH_FILA_MAXIMA', HASH_WORKERS * 4))  # pedidos aguardando um worker
+HASH_TIMEOUT = 30  # segundos
+
+_executor = None
+_pool_habilitado = False
+_executor_lock = threading.Lock()
+_vagas = threading.BoundedSemaphore(HASH_WORKERS + HASH_FILA_MAXIMA)
+
+
+class PoolSenhasSaturado(Exception):
+    """Todos os workers ocupados e a fila cheia; o cliente deve tentar novamente."""
+
+
+class _Metricas:
+    def __init__(self, amostras=500):
+        self._lock = threading.Lock()
+        self._amostras = amostras
+        self._ops = {}
+        self.rejeitados = 0
+        self.execucoes_inline = 0
+
+    def rejeitar(self):
+        with self._lock: self.rejeitados += 1
+
+    def executar_inline(self):
+        with self._lock: self.execucoes_inline += 1
+
+    def registrar(self, operacao, hash_ms, total_ms):
+        with self._lock:
+            op = self._ops.setdefault(operacao, {'chamadas': 0, 'hash': deque(maxlen=self._amostras),
+                                                 'total': deque(maxlen=self._amostras)})
+            op['chamadas'] += 1
+            op['hash'].append(hash_ms)
+            op['total'].append(total_ms)
+
+    @staticmethod
+    def _resumo(valores):
+        if not valores: return {}
+        ordenados = sorted(valores)
+        pct = lambda p: round(ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))], 1)
+        return {'media_ms': round(sum(ordenados) / len(ordenados), 1), 'p50_ms': pct(0.5),
+                'p95_ms': pct(0.95), 'max_ms': round(ordenados[-1], 1)}
+
+    def resumo(self):
+        with self._lock:
+            ops = {nome: {'chamadas': op['chamadas'],
+                          'hash': self._resumo(op['hash']),              # tempo de CPU no worker
+                          'total': self._resumo(op['total'])}            # inclui espera na fila
+                   for nome, op in self._ops.items()}
+            return {'workers': HASH_WORKERS, 'fila_maxima': HASH_FILA_MAXIMA,
+                    'rejeitados': self.rejeitados, 'execucoes_inline': self.execucoes_inline,
+                    'operacoes': ops}
+
+
+metricas = _Metricas()
+
+
+def _medir(funcao, *args):
+    # Executado no processo worker: devolve o resultado e o tempo gasto só no hash
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def init_app(app):
+    """
+    Habilita o pool de processos para o app. Nos próprios processos do pool nada é habilitado: no
+    start method spawn (Windows/macOS) cada um reimporta o módulo principal, e com ele o app.
+    """
+    global _pool_habilitado
+    _pool_habilitado = multiprocessing.current_process().name == 'MainProcess'
+
+
+def _obter_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return _executor
+
+
+def _descartar_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor: _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _executar_inline(executor, funcao, *args):
+    # Worker morto (OOM, kill): recria o pool na próxima chamada e atende esta inline
+    _descartar_executor(executor)
+    metricas.executar_inline()
+    return _medir(funcao, *args)
+
+
+def _executar(operacao, funcao, *args):
+    if not _pool_habilitado:
+        resultado, hash_ms = _medir(funcao, *args)
+        metricas.registrar(operacao, hash_ms, hash_ms)
+        return resultado
+    if not _vagas.acquire(blocking=False):
+        metricas.rejeitar()
+        raise PoolSenhasSaturado()
+    inicio = time.perf_counter()
+    executor = _obter_executor()
+    try:
+        futuro = executor.submit(_medir, funcao, *args)
+    except BrokenProcessPool:
+        _vagas.release()
+        resultado, hash_ms = _executar_inline(executor, funcao, *args)
+    except BaseException:
+        _vagas.release()
+        raise
+    else:
+        # A vaga só volta quando o worker termina de fato: depois de um timeout o hash continua
+        # ocupando o processo, e liberar antes deixaria a fila crescer além de HASH_FILA_MAXIMA
+        futuro.add_done_callback(lambda _: _vagas.release())
+        try:
+            resultado, hash_ms = futuro.result(timeout=HASH_TIMEOUT)
+        except BrokenProcessPool:
+            resultado, hash_ms = _executar_inline(executor, funcao, *args)
+        except FuturesTimeoutError:
+            # Antes do Python 3.11 é uma classe própria, não o TimeoutError embutido
+            raise PoolSenhasSaturado()
+    metricas.registrar(operacao, hash_ms, (time.perf_counter() - inicio) * 1000)
+    return resultado
+
+
+def verificar_senha(senha_hash, senha):
+    return _executar('verificar', check_password_hash, senha_hash, senha)
+
+
+def gerar_hash(senha):
+    return _executar('gerar', generate_password_hash, senha)
+
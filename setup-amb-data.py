@@ -1,6 +1,7 @@
 import sqlite3
 import os
 from datetime import datetime
+from migrations import migrar
 
 # Configuração de Caminhos
 DB_FOLDER = 'db'
@@ -13,67 +14,13 @@ def setup_ambulatorial():
     if not os.path.exists(DB_FOLDER):
         os.makedirs(DB_FOLDER)
 
+    # 1/2. Tabelas 'producao_amb' e 'producao_exame' criadas pelas migrações versionadas
+    print("Criando/Verificando tabelas 'producao_amb' e 'producao_exame'...")
+    migrar('amb', DB_AMB)
+
     conn = sqlite3.connect(DB_AMB)
     cursor = conn.cursor()
 
-    # 1. Criar Tabela de Consultas (producao_amb)
-    print("Criando/Verificando tabela 'producao_amb'...")
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS producao_amb
-                   (
-                       id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       especialidade
-                       TEXT,
-                       oferta
-                       INTEGER,
-                       agendado
-                       INTEGER,
-                       realizado
-                       INTEGER,
-                       mes
-                       TEXT,
-                       ano
-                       INTEGER,
-                       usuario
-                       TEXT,
-                       timestamp
-                       TEXT
-                   )
-                   """)
-
-    # 2. Criar Tabela de Exames (producao_exame)
-    print("Criando/Verificando tabela 'producao_exame'...")
-    cursor.execute("""
-                   CREATE TABLE IF NOT EXISTS producao_exame
-                   (
-                       id
-                       INTEGER
-                       PRIMARY
-                       KEY
-                       AUTOINCREMENT,
-                       especialidade
-                       TEXT,
-                       oferta
-                       INTEGER,
-                       agendado
-                       INTEGER,
-                       realizado
-                       INTEGER,
-                       mes
-                       TEXT,
-                       ano
-                       INTEGER,
-                       usuario
-                       TEXT,
-                       timestamp
-                       TEXT
-                   )
-                   """)
-
     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     # 3. Inserir Dados de Teste em CONSULTAS
@@ -1,5 +1,5 @@
-import sqlite3
 import os
+from migrations import migrar
 
 DB_FOLDER = 'db'
 DB_NAME = os.path.join(DB_FOLDER, 'amb.db')
@@ -10,46 +10,12 @@ def setup_db():
     if not os.path.exists(DB_FOLDER):
         os.makedirs(DB_FOLDER)
 
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # 1. Tabela de Consultas (producao_amb)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS producao_amb (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        especialidade TEXT,
-        oferta INTEGER,
-        agendado INTEGER,
-        realizado INTEGER,
-        mes TEXT,
-        ano INTEGER,
-        usuario TEXT,
-        timestamp TEXT
-    )
-    """)
-    
-    # 2. Tabela de Exames (producao_exame)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS producao_exame (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        especialidade TEXT,
-        oferta INTEGER,
-        agendado INTEGER,
-        realizado INTEGER,
-        mes TEXT,
-        ano INTEGER,
-        usuario TEXT,
-        timestamp TEXT
-    )
-    """)
-    
+    # Tabelas 'producao_amb' (consultas) e 'producao_exame' (exames) vêm das migrações versionadas
     try:
-        conn.commit()
-        print("Tabelas 'producao_amb' e 'producao_exame' verificadas com sucesso.")
+        versao = migrar('amb', DB_NAME)
+        print(f"Tabelas 'producao_amb' e 'producao_exame' verificadas com sucesso (esquema v{versao}).")
     except Exception as e:
         print(f"Erro ao criar tabelas: {e}")
-        
-    conn.close()
 
 if __name__ == '__main__':
     setup_db()
\ No newline at end of file
@@ -2,7 +2,10 @@ import sqlite3
 import pandas as pd
 import os
 import re
+import sys
 import unicodedata
+from datetime import date
+from migrations import migrar, vigiar_tabela_cadastro
 
 # --- CONFIGURAÇÃO ---
 DB_FOLDER = 'db'
@@ -19,60 +22,23 @@ ARQUIVO_ESPECIALIDADES = os.path.join(PASTA_MATRIZES, 'especialidades.csv')
 ARQUIVO_TIPO_CMA = os.path.join(PASTA_MATRIZES, 'tipo_cma.csv')
 ARQUIVO_PRODUCAO = os.path.join(PASTA_MATRIZES, 'producao.csv')
 
+# Ano atribuído às linhas de produção sem coluna 'ano' no CSV
+ANO_PRODUCAO = int(os.getenv('ANO_PRODUCAO') or date.today().year)
+
 def get_db_conn():
     return sqlite3.connect(DB_NAME)
 
 def inicializar_tabelas():
     """
-    Cria a estrutura do banco de dados (DDL) garantindo que as tabelas existam
-    mesmo se a importação de CSV falhar.
+    Cria/atualiza a estrutura do banco de dados (DDL) pelas migrações versionadas,
+    garantindo que as tabelas e índices existam mesmo se a importação de CSV falhar.
     """
-    conn = get_db_conn()
-    cursor = conn.cursor()
-    
     print(f"--- Inicializando Estrutura do Banco de Dados: {DB_NAME} ---")
-
-    # 1. Tabela Procedimentos (Padronizado para codigo_sigtap)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS procedimentos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nome TEXT,
-        codigo_sigtap TEXT UNIQUE,
-        valor_sigtap REAL
-    )
-    """)
-
-    # 2. Tabela Produção (Horizontal - Meses em Colunas)
-    # Usa codigo_sigtap para linkar
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS producao (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        codigo_sigtap TEXT,
-        tipo TEXT,
-        especialidade TEXT,
-        jan REAL DEFAULT 0,
-        fev REAL DEFAULT 0,
-        mar REAL DEFAULT 0,
-        abr REAL DEFAULT 0,
-        mai REAL DEFAULT 0,
-        jun REAL DEFAULT 0,
-        jul REAL DEFAULT 0,
-        ago REAL DEFAULT 0,
-        "set" REAL DEFAULT 0,
-        "out" REAL DEFAULT 0,
-        nov REAL DEFAULT 0,
-        dez REAL DEFAULT 0
-    )
-    """)
-
-    # 3. Tabelas Auxiliares (Genéricas)
-    # Serão recriadas dinamicamente se o CSV existir, mas criamos um stub aqui
-    cursor.execute("CREATE TABLE IF NOT EXISTS especialidades (id TEXT, especialidade TEXT)")
-    cursor.execute("CREATE TABLE IF NOT EXISTS tipo_cma (id TEXT, cirurgia TEXT)")
-
-    conn.commit()
-    conn.close()
-    print("Tabelas criadas/verificadas com sucesso.")
+    try:
+        versao = migrar('producao', DB_NAME)
+    except RuntimeError as e:
+        sys.exit(f"ERRO: {e}")
+    print(f"Tabelas criadas/verificadas com sucesso (esquema v{versao}).")
 
 def normalizar_texto(texto):
     """Limpa textos para nomes de colunas."""
@@ -129,6 +95,7 @@ def importar_procedimentos():
     
     # Garante colunas necessárias
     if 'codigo_sigtap' not in df.columns: return
+    df['codigo_sigtap'] = df['codigo_sigtap'].astype(str).str.replace('\xa0', '').str.strip()
 
     if 'valor_sigtap' in df.columns:
         df['valor_sigtap'] = df['valor_sigtap'].apply(limpar_valor_numerico)
@@ -139,8 +106,10 @@ def importar_procedimentos():
     df = df[cols_existentes]
 
     conn = get_db_conn()
-    # Append ou Replace? Replace limpa tudo e insere o novo
-    df.to_sql('procedimentos', conn, if_exists='replace', index=False)
+    # Limpa e reinsere mantendo a tabela (e seus índices) criada pelas migrações
+    conn.execute("DELETE FROM procedimentos")
+    df.to_sql('procedimentos', conn, if_exists='append', index=False)
+    conn.commit()
     conn.close()
     print(f"Procedimentos importados: {len(df)}")
 
@@ -177,24 +146,44 @@ def importar_producao():
         else:
             df_final[m] = 0.0
 
+    df_final['codigo_sigtap'] = df_final['codigo_sigtap'].astype(str).str.replace('\xa0', '').str.strip()
+    if 'tipo' not in df_final.columns: df_final['tipo'] = None
+    if 'especialidade' not in df_final.columns: df_final['especialidade'] = ''
+    df_final['especialidade'] = df_final['especialidade'].fillna('')
+
+    # Formato longo: uma linha por (código, ano, mês, especialidade)
+    col_ano = next((c for c in cols_norm if c == 'ano'), None)
+    df_final['ano'] = pd.to_numeric(df[mapa_orig[col_ano]], errors='coerce').fillna(ANO_PRODUCAO).astype(int) if col_ano else ANO_PRODUCAO
+    df_longo = df_final.melt(id_vars=['codigo_sigtap', 'especialidade', 'ano'], value_vars=meses, var_name='mes', value_name='quantidade')
+    df_longo['mes'] = df_longo['mes'].map({m: i for i, m in enumerate(meses, start=1)})
+    df_longo = df_longo[df_longo['quantidade'] != 0]
+    df_longo = df_longo.groupby(['codigo_sigtap', 'ano', 'mes', 'especialidade'], as_index=False)['quantidade'].sum()
+
     conn = get_db_conn()
-    # Drop para garantir schema limpo
-    cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS producao") 
-    # Recria schema correto (para garantir tipos REAL e nomes com aspas)
-    cursor.execute("""
-    CREATE TABLE producao (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        codigo_sigtap TEXT,
-        tipo TEXT,
-        especialidade TEXT,
-        jan REAL, fev REAL, mar REAL, abr REAL, mai REAL, jun REAL,
-        jul REAL, ago REAL, "set" REAL, "out" REAL, nov REAL, dez REAL
-    )
+    anos = sorted(df_longo['ano'].unique().tolist()) or [ANO_PRODUCAO]
+    conn.executemany("DELETE FROM producao_fato WHERE ano = ?", [(int(a),) for a in anos])
+    # Classificações: a do CSV prevalece (tipo atualizado, ids preservados) e as que saíram do CSV são removidas.
+    # Código/especialidade repetido no CSV: vale a primeira linha, como na antiga tabela horizontal.
+    classificacoes = df_final[['codigo_sigtap', 'especialidade', 'tipo']].drop_duplicates(['codigo_sigtap', 'especialidade'])
+    classificacoes = [(c, e, None if pd.isna(t) else t) for c, e, t in classificacoes.itertuples(index=False, name=None)]
+    conn.executemany("""
+        INSERT INTO producao_classificacao (codigo_sigtap, especialidade, tipo) VALUES (?, ?, ?)
+        ON CONFLICT (codigo_sigtap, especialidade) DO UPDATE SET tipo = excluded.tipo
+    """, classificacoes)
+    conn.execute("CREATE TEMP TABLE classificacoes_csv (codigo_sigtap TEXT, especialidade TEXT, PRIMARY KEY (codigo_sigtap, especialidade))")
+    conn.executemany("INSERT INTO classificacoes_csv VALUES (?, ?)", [(c, e) for c, e, _ in classificacoes])
+    conn.execute("""
+        DELETE FROM producao_classificacao
+        WHERE NOT EXISTS (SELECT 1 FROM classificacoes_csv n
+                          WHERE n.codigo_sigtap = producao_classificacao.codigo_sigtap
+                            AND n.especialidade = producao_classificacao.especialidade)
     """)
-    df_final.to_sql('producao', conn, if_exists='append', index=False)
+    conn.execute("DROP TABLE classificacoes_csv")
+    conn.executemany("INSERT INTO producao_fato (codigo_sigtap, ano, mes, especialidade, quantidade) VALUES (?, ?, ?, ?, ?)",
+                     [(c, int(a), int(m), e, float(q)) for c, a, m, e, q in df_longo[['codigo_sigtap', 'ano', 'mes', 'especialidade', 'quantidade']].itertuples(index=False, name=None)])
+    conn.commit()
     conn.close()
-    print(f"Produção importada: {len(df_final)}")
+    print(f"Produção importada: {len(df_final)} linhas, {len(df_longo)} lançamentos mensais (anos: {anos})")
 
 def importar_auxiliar(nome, arquivo):
     print(f"Importando {nome}...")
@@ -204,6 +193,9 @@ def importar_auxiliar(nome, arquivo):
     df.columns = [normalizar_texto(c) for c in df.columns]
     conn = get_db_conn()
     df.to_sql(nome, conn, if_exists='replace', index=False)
+    # O replace recria a tabela sem os triggers que avisam o catálogo em memória
+    vigiar_tabela_cadastro(conn, nome)
+    conn.commit()
     conn.close()
     print(f"{nome} importada: {len(df)}")
 
@@ -1,7 +1,7 @@
 import time
 import os
 import glob
-import pandas as pd
+from formatos import detectar_formato, ler_tabela, FormatoNaoSuportado
 import pytesseract
 from PIL import Image
 from io import BytesIO
@@ -56,29 +56,17 @@ def configurar_navegador():
 
 def carregar_dataframe(filepath, callback_log):
     """
-    Tenta carregar o arquivo baixado em um DataFrame Pandas.
-    Lida com a peculiaridade de sistemas antigos exportarem HTML como .xls.
+    Carrega o arquivo baixado em um DataFrame Pandas.
+    O formato é detectado pela assinatura do arquivo (o SIRESP exporta HTML com extensão .xls).
     """
+    formato = detectar_formato(filepath)
+    callback_log(f"Formato detectado: {formato.tipo}")
     try:
-        # Tentativa 1: Excel Padrão (.xlsx ou .xls real)
-        return pd.read_excel(filepath)
-    except Exception as e_excel:
-        callback_log(f"Aviso: Falha ao ler como Excel nativo ({str(e_excel)}). Tentando HTML...")
-        try:
-            # Tentativa 2: Tabela HTML salva como .xls (Comum em PHP legado)
-            # Requer lxml ou html5lib instalados
-            tabelas = pd.read_html(filepath, decimal=',', thousands='.')
-            if tabelas:
-                return tabelas[0]
-            else:
-                raise Exception("Nenhuma tabela encontrada no HTML.")
-        except Exception as e_html:
-            callback_log(f"Aviso: Falha ao ler como HTML ({str(e_html)}). Tentando CSV...")
-            try:
-                # Tentativa 3: CSV mascarado
-                return pd.read_csv(filepath, sep=';', encoding='latin1')
-            except Exception as e_csv:
-                raise Exception(f"Não foi possível ler o arquivo. Formatos Excel, HTML e CSV falharam.")
+        return ler_tabela(filepath, formato=formato)
+    except FormatoNaoSuportado:
+        raise
+    except Exception as e:
+        raise Exception(f"Não foi possível ler o arquivo ({formato.tipo}): {str(e)}")
 
 def run_siresp_extraction(callback_log):
     driver = None
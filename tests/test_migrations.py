@@ -0,0 +1,51 @@
+import sqlite3
+
+from catalogo import CatalogoProcedimentos
+from migrations import migrar
+
+CODIGO = '04.05.01.001-0'
+
+
+def _banco_legado(caminho):
+    """Banco no formato anterior às migrações, com o código SIGTAP terminando em NBSP nas duas tabelas."""
+    conn = sqlite3.connect(caminho)
+    conn.executescript("""
+        CREATE TABLE procedimentos (nome TEXT, codigo_sigtap TEXT, valor_sigtap REAL);
+        CREATE TABLE producao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, codigo_sigtap TEXT, tipo TEXT, especialidade TEXT,
+            jan REAL DEFAULT 0, fev REAL DEFAULT 0, mar REAL DEFAULT 0, abr REAL DEFAULT 0,
+            mai REAL DEFAULT 0, jun REAL DEFAULT 0, jul REAL DEFAULT 0, ago REAL DEFAULT 0,
+            "set" REAL DEFAULT 0, "out" REAL DEFAULT 0, nov REAL DEFAULT 0, dez REAL DEFAULT 0
+        );
+        CREATE TABLE especialidades (codigo TEXT, especialidade TEXT);
+        CREATE TABLE tipo_cma (tipo TEXT, cirurgia TEXT);
+    """)
+    conn.execute("INSERT INTO procedimentos VALUES ('TRABECULECTOMIA', ?, 100.0)", (CODIGO + '\xa0',))
+    conn.execute("INSERT INTO producao (codigo_sigtap, tipo, especialidade, jul) VALUES (?, '2', '7', 4)", (CODIGO + '\xa0',))
+    conn.execute("INSERT INTO especialidades VALUES ('7', 'Oftalmologia')")
+    conn.execute("INSERT INTO tipo_cma VALUES ('2', 'Cirurgia Maior')")
+    conn.commit()
+    conn.close()
+
+
+def test_codigo_com_nbsp_mantem_producao_e_classificacao(tmp_path, monkeypatch):
+    caminho = str(tmp_path / 'producao.db')
+    _banco_legado(caminho)
+    monkeypatch.setenv('ANO_PRODUCAO_LEGADA', '2025')
+    migrar('producao', caminho, verbose=False)
+
+    conn = sqlite3.connect(caminho)
+    assert conn.execute("SELECT codigo_sigtap FROM procedimentos").fetchall() == [(CODIGO,)]
+    assert conn.execute("""
+        SELECT c.tipo, c.especialidade, f.ano, f.mes, f.quantidade
+        FROM procedimentos p
+        JOIN producao_classificacao c ON c.codigo_sigtap = p.codigo_sigtap
+        JOIN producao_fato f ON f.codigo_sigtap = p.codigo_sigtap
+    """).fetchall() == [('2', '7', 2025, 7, 4.0)]
+    conn.close()
+
+    catalogo = CatalogoProcedimentos(caminho)
+    proc = catalogo.obter(CODIGO)
+    assert (proc.tipo, proc.especialidade) == ('Cirurgia Maior', 'Oftalmologia')
+    assert catalogo.total_mes(CODIGO, 2025, 7) == 4.0
+    assert [p.codigo for p in catalogo.buscar('0405010010')] == [CODIGO]